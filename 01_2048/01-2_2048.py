@@ -1,9 +1,16 @@
 """
 Clone of 2048 game.
+
+The engine has no GUI dependency and can be imported by worker
+processes.  Running the file with no arguments starts the GUI; with
+arguments it plays a batch of headless games, e.g.
+
+    python 01-2_2048.py --games 1000 --policy corner --processes 8
 """
 
-import poc_2048_gui
+import bisect
 import random
+import time
 
 # Directions, DO NOT MODIFY
 UP = 1
@@ -18,13 +25,65 @@ OFFSETS = {UP: (1, 0),
            LEFT: (0, 1),
            RIGHT: (0, -1)}
 
+# Each move log record is 3 bytes: the direction (0 for the opening
+# tiles) in the low nibble and the log2 of the spawned tile (0 for no
+# spawn) in the high nibble, then the spawn cell index, big-endian.
+LOG_RECORD_SIZE = 3
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+def splitmix64(value):
+    """
+    Scramble a 64-bit integer with the SplitMix64 finalizer.
+    """
+    value = (value + 0x9E3779B97F4A7C15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+class SeedStream:
+    """
+    Counter-based source of independent random number generators.
+    The generator for index i is derived directly from the seed and
+    i, so any game of a seeded batch can be replayed on its own.
+    """
+
+    def __init__(self, seed):
+        self._key = splitmix64(seed & MASK64)
+
+    def seed_for(self, index):
+        """
+        Return the 64-bit seed for the given index.
+        """
+        return splitmix64(self._key ^ splitmix64(index & MASK64))
+
+    def rng(self, index):
+        """
+        Return a fresh random.Random for the given index.
+        """
+        return random.Random(self.seed_for(index))
+
+    def split(self, index):
+        """
+        Return an independent child stream, e.g. one per worker.
+        """
+        return SeedStream(self.seed_for(index))
+
 def merge(line):
     """
     Helper function that merges a single row or column in 2048
     """
+    return merge_and_score(line)[0]
+
+def merge_and_score(line):
+    """
+    Merges a single row or column and also returns the points
+    scored, as a tuple (merged line, score).
+    """
     numbers = list_numbers(line)
     zeroes = list_zeroes(line)
     merged_tiles = []
+    score = 0
 
     for item in range(len(numbers)):
         if len(merged_tiles) == 0:
@@ -34,12 +93,19 @@ def merge(line):
             zeroes.append(0)
         elif merged_tiles[-1] == numbers[item]:
             merged_tiles[-1] += numbers[item]
+            score += merged_tiles[-1]
             merged_tiles.append(0)
         else:
             merged_tiles.append(numbers[item])
 
     merged = merged_tiles + zeroes
-    return merged
+    return merged, score
+
+def line_score(line):
+    """
+    Return the points scored by merging a single row or column.
+    """
+    return merge_and_score(line)[1]
 
 def list_zeroes(line):
     """
@@ -66,7 +132,11 @@ class TwentyFortyEight:
     Class to run the game logic.
     """
 
-    def __init__(self, grid_height, grid_width):
+    def __init__(self, grid_height, grid_width, rng=None, record=False):
+        if rng is None:
+            rng = random
+        self._rng = rng
+        self._record = record
         self._grid_height = grid_height
         self._grid_width = grid_width
         self._directions = {UP: [], DOWN: [], LEFT: [], RIGHT: []}
@@ -86,7 +156,21 @@ class TwentyFortyEight:
         """
         self._grid = [[0 for dummy_col in range(self._grid_width)]
                       for dummy_row in range(self._grid_height)]
-        self._empty = self.get_empty()
+
+        # Empty cells are kept in a list with a reverse index so that
+        # cells can be added, swap-removed and sampled in O(1).
+        self._empty = []
+        self._empty_index = {}
+        for row in range(self._grid_height):
+            for col in range(self._grid_width):
+                self._empty_index[(row, col)] = len(self._empty)
+                self._empty.append((row, col))
+        self._score = 0
+
+        # The move log is None when the game is not being recorded.
+        self._log = None
+        if self._record:
+            self._log = bytearray()
         self.new_tile()
         self.new_tile()
 
@@ -108,12 +192,47 @@ class TwentyFortyEight:
         """
         return self._grid_width
 
-    def move(self, direction):
+    def get_score(self):
+        """
+        Get the total points scored by merges so far.
+        """
+        return self._score
+
+    def get_log(self):
+        """
+        Return the move log as bytes, or None if the game is not
+        being recorded.
+        """
+        if self._log is None:
+            return None
+        return bytes(self._log)
+
+    def log_move(self, direction, spawned):
+        """
+        Append a record for a move in the given direction (0 for the
+        opening tiles) that spawned the tile (row, col, value), or
+        None if no tile was added.  Does nothing when not recording.
+        """
+        if self._log is None:
+            return
+        if spawned is None:
+            cell = 0
+            exponent = 0
+        else:
+            cell = spawned[0] * self._grid_width + spawned[1]
+            exponent = EXPONENTS[spawned[2]]
+        self._log.append(direction | (exponent << 4))
+        self._log.append(cell >> 8)
+        self._log.append(cell & 0xFF)
+
+    def move(self, direction, spawn=True):
         """
         Move all tiles in the given direction and add
-        a new tile if any tiles moved.
+        a new tile if any tiles moved (unless spawn is False).
+        Returns a tuple (changed, score gained).
         """
         changed = False
+        score = 0
         if direction == UP or direction == DOWN:
             max_steps = self._grid_height
         else:
@@ -125,39 +244,137 @@ class TwentyFortyEight:
                 row = initial[0] + step * OFFSETS[direction][0]
                 col = initial[1] + step * OFFSETS[direction][1]
                 to_merge.append(self.get_tile(row, col))
-            merged = merge(to_merge)
-            if merged != to_merge:
-                changed = True
+            merged, line_points = merge_and_score(to_merge)
+            if merged == to_merge:
+                continue
+            changed = True
+            score += line_points
 
             for step in range(max_steps):
-                row = initial[0] + step * OFFSETS[direction][0]
-                col = initial[1] + step * OFFSETS[direction][1]
-                self.set_tile(row, col, merged[step])
-        if changed == True:
-            self.new_tile()
+                if merged[step] != to_merge[step]:
+                    row = initial[0] + step * OFFSETS[direction][0]
+                    col = initial[1] + step * OFFSETS[direction][1]
+                    self.set_tile(row, col, merged[step])
+        if changed:
+            self._score += score
+            spawned = None
+            if spawn:
+                spawned = self._spawn()
+            self.log_move(direction, spawned)
+        return changed, score
+
+    def replay(self, log):
+        """
+        Replace the board and score with those reached by the moves
+        in a move log.  The log can be cut short at any record to get
+        the board at that point.
+        """
+        recording = self._log
+        self._log = None
+        for row in range(self._grid_height):
+            for col in range(self._grid_width):
+                self.set_tile(row, col, 0)
+        self._score = 0
+
+        log = bytearray(log)
+        for start in range(0, len(log) - LOG_RECORD_SIZE + 1, LOG_RECORD_SIZE):
+            direction = log[start] & 0xF
+            exponent = log[start] >> 4
+            cell = (log[start + 1] << 8) | log[start + 2]
+            if direction != 0:
+                self.move(direction, spawn=False)
+            if exponent != 0:
+                self.set_tile(cell // self._grid_width, cell % self._grid_width,
+                              2 ** exponent)
+
+        if recording is not None:
+            self._log = log[:len(log) - len(log) % LOG_RECORD_SIZE]
+
+    def can_move(self, direction):
+        """
+        Return True if moving in the given direction would change
+        the board.  Only looks at neighbouring tiles.
+        """
+        if direction == UP or direction == DOWN:
+            max_steps = self._grid_height
+        else:
+            max_steps = self._grid_width
+        step_row, step_col = OFFSETS[direction]
+
+        for initial in self._directions[direction]:
+            row, col = initial
+            previous = self._grid[row][col]
+            for dummy_step in range(1, max_steps):
+                row += step_row
+                col += step_col
+                value = self._grid[row][col]
+                if value != 0 and (previous == 0 or previous == value):
+                    return True
+                previous = value
+        return False
+
+    def legal_moves(self):
+        """
+        Return the list of directions that would change the board.
+        """
+        return [direction for direction in (UP, DOWN, LEFT, RIGHT)
+                if self.can_move(direction)]
+
+    def is_game_over(self):
+        """
+        Return True if no move can change the board.
+        """
+        # With no empty cells, LEFT and RIGHT (and UP and DOWN) are
+        # legal exactly when some neighbouring pair matches.
+        return (len(self._empty) == 0 and not self.can_move(LEFT)
+                and not self.can_move(UP))
 
     def new_tile(self):
         """
         Create a new tile in a randomly selected empty
         square.  The tile should be 2 90% of the time and
-        4 10% of the time.
+        4 10% of the time.  Returns the new tile as a tuple
+        (row, col, value), or None if the grid is full.
+        The tile is logged on its own, so agents that move with
+        spawn=False and then call new_tile still replay correctly.
+        """
+        spawned = self._spawn()
+        if spawned is not None:
+            self.log_move(0, spawned)
+        return spawned
+
+    def _spawn(self):
+        """
+        Same as new_tile, without logging the tile.
         """
-        self.get_empty()
         if len(self._empty) > 0:
-            tile_loc = random.choice(self._empty)
-            randomizer = random.random()
+            tile_loc = self._empty[self._rng.randrange(len(self._empty))]
+            randomizer = self._rng.random()
             if randomizer < .9:
                 tile_value = 2
             else:
                 tile_value = 4
             self.set_tile(tile_loc[0], tile_loc[1], tile_value)
+            return (tile_loc[0], tile_loc[1], tile_value)
+        return None
 
 
     def set_tile(self, row, col, value):
         """
         Set the tile at position row, col to have the given value.
         """
+        old_value = self._grid[row][col]
         self._grid[row][col] = value
+        if old_value == 0 and value != 0:
+            # Swap-remove the cell from the empty list.
+            index = self._empty_index.pop((row, col))
+            last = self._empty.pop()
+            if index < len(self._empty):
+                self._empty[index] = last
+                self._empty_index[last] = index
+        elif old_value != 0 and value == 0:
+            self._empty_index[(row, col)] = len(self._empty)
+            self._empty.append((row, col))
 
     def get_tile(self, row, col):
         """
@@ -169,11 +386,1014 @@ class TwentyFortyEight:
         """
         Return list of empty cells.
         """
-        self._empty = []
-        for row in range(len(self._grid)):
-            for col in range(len(self._grid[row])):
-                if self._grid[row][col] == 0:
-                    self._empty.append([row, col])
-        return self._empty
+        return [[row, col] for (row, col) in sorted(self._empty)]
+
+def replay_log(grid_height, grid_width, log):
+    """
+    Rebuild a recorded game of the given size from its move log.
+    """
+    game = TwentyFortyEight(grid_height, grid_width, record=True)
+    game.replay(log)
+    return game
+
+# Bitboard engine.  A 4x4 board is packed into a single integer with
+# one 4-bit log2 exponent per cell: row r occupies bits 16r..16r+15 and
+# column c within a row occupies bits 4c..4c+3.  An exponent of 0 is an
+# empty cell, so the largest representable tile is 2 ** 15, and two of
+# those do not merge.
+ROW_MASK = 0xFFFF
+EMPTY_MASK = 0x1111111111111111
+EXPONENTS = dict([(0, 0)] + [(2 ** exp, exp) for exp in range(1, 16)])
+ROW_LEFT = []
+ROW_RIGHT = []
+ROW_SCORE = []
+
+def merge_row(row):
+    """
+    Merge a packed 16-bit row of exponents towards column 0.
+    """
+    return merge_row_and_score(row)[0]
+
+def merge_row_and_score(row):
+    """
+    Merges a packed 16-bit row of exponents towards column 0 and also
+    returns the points scored, as a tuple (merged row, score).
+    """
+    line = [(row >> (4 * col)) & 0xF for col in range(4)]
+    numbers = list_numbers(line)
+    merged = []
+    score = 0
+    while len(numbers) > 0:
+        if len(numbers) > 1 and numbers[0] == numbers[1] and numbers[0] < 15:
+            merged.append(numbers[0] + 1)
+            score += 2 ** (numbers[0] + 1)
+            numbers = numbers[2:]
+        else:
+            merged.append(numbers[0])
+            numbers = numbers[1:]
+    merged += [0] * (4 - len(merged))
+
+    result = 0
+    for col in range(4):
+        result |= merged[col] << (4 * col)
+    return result, score
+
+def reverse_row(row):
+    """
+    Reverse the order of the four cells in a packed 16-bit row.
+    """
+    return (((row & 0xF) << 12) | ((row & 0xF0) << 4) |
+            ((row >> 4) & 0xF0) | (row >> 12))
+
+def build_row_tables():
+    """
+    Fill the 65,536-entry row lookup tables used by the bitboard
+    engine.  Only the first call does any work.
+    """
+    if len(ROW_LEFT) > 0:
+        return
+    for row in range(ROW_MASK + 1):
+        merged, score = merge_row_and_score(row)
+        ROW_LEFT.append(merged)
+        ROW_SCORE.append(score)
+    for row in range(ROW_MASK + 1):
+        ROW_RIGHT.append(reverse_row(ROW_LEFT[reverse_row(row)]))
+
+def transpose(board):
+    """
+    Transpose a packed 4x4 board so that columns become rows.
+    """
+    part1 = board & 0xF0F00F0FF0F00F0F
+    part2 = board & 0x0000F0F00000F0F0
+    part3 = board & 0x0F0F00000F0F0000
+    board = part1 | (part2 << 12) | (part3 >> 12)
+    part1 = board & 0xFF00FF0000FF00FF
+    part2 = board & 0x00FF00FF00000000
+    part3 = board & 0x00000000FF00FF00
+    return part1 | (part2 >> 24) | (part3 << 24)
+
+def apply_rows(board, table):
+    """
+    Run every row of a packed board through a row lookup table.
+    """
+    return (table[board & ROW_MASK] |
+            (table[(board >> 16) & ROW_MASK] << 16) |
+            (table[(board >> 32) & ROW_MASK] << 32) |
+            (table[(board >> 48) & ROW_MASK] << 48))
+
+def bitboard_move(board, direction):
+    """
+    Return the packed board that results from sliding every tile of
+    a packed board in the given direction.  No new tile is added.
+    """
+    if direction == LEFT:
+        return apply_rows(board, ROW_LEFT)
+    elif direction == RIGHT:
+        return apply_rows(board, ROW_RIGHT)
+    elif direction == UP:
+        return transpose(apply_rows(transpose(board), ROW_LEFT))
+    else:
+        return transpose(apply_rows(transpose(board), ROW_RIGHT))
+
+class BitboardTwentyFortyEight:
+    """
+    Table-driven 4x4 game engine with the same interface as
+    TwentyFortyEight.
+    """
+
+    def __init__(self, grid_height=4, grid_width=4, rng=None):
+        if grid_height != 4 or grid_width != 4:
+            raise ValueError("the bitboard engine only supports 4x4 grids")
+        if rng is None:
+            rng = random
+        self._rng = rng
+        build_row_tables()
+        self._grid_height = grid_height
+        self._grid_width = grid_width
+        self.reset()
+
+    def reset(self):
+        """
+        Reset the game so the grid is empty except for two
+        initial tiles.
+        """
+        self._board = 0
+        self._score = 0
+        self.new_tile()
+        self.new_tile()
+
+    def __str__(self):
+        """
+        Return a string representation of the grid for debugging.
+        """
+        return '\n'.join(str([self.get_tile(row, col) for col in range(4)])
+                         for row in range(4))
+
+    def get_grid_height(self):
+        """
+        Get the height of the board.
+        """
+        return self._grid_height
+
+    def get_grid_width(self):
+        """
+        Get the width of the board.
+        """
+        return self._grid_width
+
+    def get_score(self):
+        """
+        Get the total points scored by merges so far.
+        """
+        return self._score
+
+    def get_board(self):
+        """
+        Return the packed integer representation of the board.
+        """
+        return self._board
+
+    def move(self, direction, spawn=True):
+        """
+        Move all tiles in the given direction and add
+        a new tile if any tiles moved (unless spawn is False).
+        Returns a tuple (changed, score gained).
+        """
+        board = bitboard_move(self._board, direction)
+        if board == self._board:
+            return False, 0
+        if direction == LEFT or direction == RIGHT:
+            rows = self._board
+        else:
+            rows = transpose(self._board)
+        score = (ROW_SCORE[rows & ROW_MASK] +
+                 ROW_SCORE[(rows >> 16) & ROW_MASK] +
+                 ROW_SCORE[(rows >> 32) & ROW_MASK] +
+                 ROW_SCORE[(rows >> 48) & ROW_MASK])
+        self._board = board
+        self._score += score
+        if spawn:
+            self.new_tile()
+        return True, score
+
+    def can_move(self, direction):
+        """
+        Return True if moving in the given direction would change
+        the board.
+        """
+        return bitboard_move(self._board, direction) != self._board
+
+    def legal_moves(self):
+        """
+        Return the list of directions that would change the board.
+        """
+        return [direction for direction in (UP, DOWN, LEFT, RIGHT)
+                if self.can_move(direction)]
+
+    def is_game_over(self):
+        """
+        Return True if no move can change the board.
+        """
+        return len(self.legal_moves()) == 0
+
+    def new_tile(self):
+        """
+        Create a new tile in a randomly selected empty
+        square.  The tile should be 2 90% of the time and
+        4 10% of the time.  Returns the new tile as a tuple
+        (row, col, value), or None if the grid is full.
+        """
+        # One bit at the bottom of each empty cell's nibble.
+        empty = self._board | (self._board >> 2)
+        empty = ~(empty | (empty >> 1)) & EMPTY_MASK
+        num_empty = bin(empty).count('1')
+        if num_empty > 0:
+            for dummy in range(self._rng.randrange(num_empty)):
+                empty &= empty - 1
+            shift = (empty & -empty).bit_length() - 1
+            if self._rng.random() < .9:
+                exponent = 1
+            else:
+                exponent = 2
+            self._board |= exponent << shift
+            return (shift // 16, (shift // 4) % 4, 2 ** exponent)
+        return None
+
+    def set_tile(self, row, col, value):
+        """
+        Set the tile at position row, col to have the given value.
+        """
+        shift = 4 * (4 * row + col)
+        self._board = ((self._board & ~(0xF << shift)) |
+                       (EXPONENTS[value] << shift))
+
+    def get_tile(self, row, col):
+        """
+        Return the value of the tile at position row, col.
+        """
+        exp = (self._board >> (4 * (4 * row + col))) & 0xF
+        if exp == 0:
+            return 0
+        return 2 ** exp
+
+    def get_empty(self):
+        """
+        Return list of empty cells.
+        """
+        empty = []
+        for cell in range(16):
+            if (self._board >> (4 * cell)) & 0xF == 0:
+                empty.append([cell // 4, cell % 4])
+        return empty
+
+class TwentyFortyEightBatch:
+    """
+    Class to run many independent games of any size in lock step.
+    Board i spawns tiles from its own generator, stream.rng(first_game
+    + i), so its game only depends on the stream and its own moves and
+    can be replayed on its own with a batch of one.
+
+    When NumPy is available (and use_numpy is not False) the boards
+    are held in one (N, H, W) array and moves are applied to all
+    boards at once; otherwise each board is a list with a sorted list
+    of its empty cells.  Both give the same games for the same stream:
+    a new tile goes in the k-th empty cell in row-major order, with k
+    drawn by randrange.
+    """
+
+    def __init__(self, num_boards, grid_height, grid_width, stream=None,
+                 first_game=0, use_numpy=None):
+        if stream is None:
+            stream = SeedStream(random.getrandbits(64))
+        self._rngs = [stream.rng(first_game + board)
+                      for board in range(num_boards)]
+        self._num_boards = num_boards
+        self._grid_height = grid_height
+        self._grid_width = grid_width
+        self._merged = {}
+
+        self._np = None
+        if use_numpy is not False:
+            try:
+                import numpy
+                self._np = numpy
+            except ImportError:
+                if use_numpy:
+                    raise
+
+        # Flat cell indices of every line, in merge order, for each
+        # direction.
+        self._lines = {UP: [], DOWN: [], LEFT: [], RIGHT: []}
+        starts = {UP: [(0, col) for col in range(grid_width)],
+                  DOWN: [(grid_height - 1, col) for col in range(grid_width)],
+                  LEFT: [(row, 0) for row in range(grid_height)],
+                  RIGHT: [(row, grid_width - 1) for row in range(grid_height)]}
+        for direction in starts:
+            if direction == UP or direction == DOWN:
+                max_steps = grid_height
+            else:
+                max_steps = grid_width
+            for initial in starts[direction]:
+                line = []
+                for step in range(max_steps):
+                    row = initial[0] + step * OFFSETS[direction][0]
+                    col = initial[1] + step * OFFSETS[direction][1]
+                    line.append(row * grid_width + col)
+                self._lines[direction].append(line)
+        if self._np is not None:
+            self._line_cells = dict((direction, self._np.array(lines))
+                                    for direction, lines in self._lines.items())
+        self.reset()
+
+    def reset(self):
+        """
+        Reset every game so its grid is empty except for two
+        initial tiles.
+        """
+        num_cells = self._grid_height * self._grid_width
+        if self._np is not None:
+            self._grids = self._np.zeros((self._num_boards, self._grid_height,
+                                          self._grid_width), self._np.int64)
+        else:
+            self._grids = [[0] * num_cells
+                           for dummy_board in range(self._num_boards)]
+            self._empty = [list(range(num_cells))
+                           for dummy_board in range(self._num_boards)]
+        for board in range(self._num_boards):
+            self.new_tile(board)
+            self.new_tile(board)
+
+    def get_num_boards(self):
+        """
+        Get the number of games in the batch.
+        """
+        return self._num_boards
+
+    def get_grid_height(self):
+        """
+        Get the height of each board.
+        """
+        return self._grid_height
+
+    def get_grid_width(self):
+        """
+        Get the width of each board.
+        """
+        return self._grid_width
+
+    def get_grid(self, board):
+        """
+        Return a copy of one board as a list of rows.
+        """
+        if self._np is not None:
+            return [[int(value) for value in row]
+                    for row in self._grids[board]]
+        grid = self._grids[board]
+        width = self._grid_width
+        return [grid[row * width:(row + 1) * width]
+                for row in range(self._grid_height)]
+
+    def merge_line(self, line):
+        """
+        Return merge(line) as a tuple, caching the result since the
+        same lines come up over and over across a batch.
+        """
+        merged = self._merged.get(line)
+        if merged is None:
+            if len(self._merged) > 1 << 18:
+                self._merged.clear()
+            merged = tuple(merge(line))
+            self._merged[line] = merged
+        return merged
+
+    def move(self, directions):
+        """
+        Move every board in its own direction and add a new tile
+        to each board that changed.  Takes either one direction for
+        the whole batch or a sequence with one direction per board,
+        and returns a list of flags saying which boards changed.
+        """
+        if not hasattr(directions, '__len__'):
+            directions = [directions] * self._num_boards
+        if self._np is not None:
+            return self.move_arrays(directions)
+        changed = [False] * self._num_boards
+
+        for board in range(self._num_boards):
+            grid = self._grids[board]
+            empty = self._empty[board]
+            for indices in self._lines[directions[board]]:
+                line = tuple([grid[index] for index in indices])
+                merged = self.merge_line(line)
+                if merged != line:
+                    changed[board] = True
+                    for step in range(len(indices)):
+                        index = indices[step]
+                        if line[step] == 0 and merged[step] != 0:
+                            del empty[bisect.bisect_left(empty, index)]
+                        elif line[step] != 0 and merged[step] == 0:
+                            bisect.insort(empty, index)
+                        grid[index] = merged[step]
+            if changed[board]:
+                self.new_tile(board)
+        return changed
+
+    def merge_arrays(self, lines):
+        """
+        Merge every row of a 2D array of lines towards column 0, the
+        same way merge does, and return the result.
+        """
+        numpy = self._np
+        order = numpy.argsort(lines == 0, axis=1, kind='stable')
+        lines = numpy.take_along_axis(lines, order, axis=1)
+        for col in range(lines.shape[1] - 1):
+            pairs = (lines[:, col] == lines[:, col + 1]) & (lines[:, col] != 0)
+            lines[pairs, col] *= 2
+            lines[pairs, col + 1] = 0
+        order = numpy.argsort(lines == 0, axis=1, kind='stable')
+        return numpy.take_along_axis(lines, order, axis=1)
+
+    def move_arrays(self, directions):
+        """
+        Same as move for the NumPy boards.  Boards are grouped by
+        direction, their lines gathered into one array per direction,
+        merged together and scattered back.
+        """
+        numpy = self._np
+        directions = numpy.asarray(directions)
+        flat = self._grids.reshape(self._num_boards, -1)
+        changed = numpy.zeros(self._num_boards, bool)
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            boards = numpy.flatnonzero(directions == direction)
+            if len(boards) == 0:
+                continue
+            cells = self._line_cells[direction]
+            lines = flat[boards][:, cells]
+            merged = self.merge_arrays(
+                lines.reshape(-1, cells.shape[1])).reshape(lines.shape)
+            moved = (merged != lines).reshape(len(boards), -1).any(axis=1)
+            boards = boards[moved]
+            changed[boards] = True
+            after = flat[boards]
+            after[:, cells] = merged[moved]
+            flat[boards] = after
+        self.spawn_arrays(numpy.flatnonzero(changed))
+        return changed.tolist()
+
+    def spawn_arrays(self, boards):
+        """
+        Add a new tile to each of the given NumPy boards, drawing from
+        each board's own generator.
+        """
+        numpy = self._np
+        flat = self._grids.reshape(self._num_boards, -1)
+        empty = flat[boards] == 0
+        counts = empty.sum(axis=1)
+        picks = numpy.zeros(len(boards), numpy.int64)
+        values = numpy.zeros(len(boards), numpy.int64)
+        for index in range(len(boards)):
+            if counts[index] > 0:
+                rng = self._rngs[boards[index]]
+                picks[index] = rng.randrange(int(counts[index]))
+                if rng.random() < .9:
+                    values[index] = 2
+                else:
+                    values[index] = 4
+        # The pick-th empty cell is the first whose running count of
+        # empty cells passes pick.
+        cells = (empty.cumsum(axis=1) > picks[:, None]).argmax(axis=1)
+        full = counts == 0
+        flat[boards[~full], cells[~full]] = values[~full]
+
+    def new_tile(self, board):
+        """
+        Create a new tile in a randomly selected empty square of
+        one board.  The tile should be 2 90% of the time and 4 10%
+        of the time.
+        """
+        if self._np is not None:
+            self.spawn_arrays(self._np.array([board]))
+            return
+        empty = self._empty[board]
+        rng = self._rngs[board]
+        if len(empty) > 0:
+            tile_loc = empty.pop(rng.randrange(len(empty)))
+            if rng.random() < .9:
+                self._grids[board][tile_loc] = 2
+            else:
+                self._grids[board][tile_loc] = 4
+
+    def set_tile(self, board, row, col, value):
+        """
+        Set the tile at position row, col of one board to have the
+        given value.
+        """
+        if self._np is not None:
+            self._grids[board, row, col] = value
+            return
+        index = row * self._grid_width + col
+        empty = self._empty[board]
+        if self._grids[board][index] == 0 and value != 0:
+            del empty[bisect.bisect_left(empty, index)]
+        elif self._grids[board][index] != 0 and value == 0:
+            bisect.insort(empty, index)
+        self._grids[board][index] = value
+
+    def get_tile(self, board, row, col):
+        """
+        Return the value of the tile at position row, col of one
+        board.
+        """
+        if self._np is not None:
+            return int(self._grids[board, row, col])
+        return self._grids[board][row * self._grid_width + col]
+
+# Weights for the expectimax row heuristic.
+HEUR_LOST_PENALTY = 200000.0
+HEUR_MONO_POWER = 4.0
+HEUR_MONO_WEIGHT = 47.0
+HEUR_SUM_POWER = 3.5
+HEUR_SUM_WEIGHT = 11.0
+HEUR_MERGES_WEIGHT = 700.0
+HEUR_EMPTY_WEIGHT = 270.0
+ROW_HEURISTIC = []
+
+def score_row(row):
+    """
+    Heuristic value of a packed 16-bit row: rewards empty cells,
+    pending merges and monotonic rows, and penalizes large tiles
+    that are spread out.
+    """
+    line = [(row >> (4 * col)) & 0xF for col in range(4)]
+    total = 0.0
+    empty = 0
+    merges = 0
+    prev = 0
+    counter = 0
+    for rank in line:
+        total += rank ** HEUR_SUM_POWER
+        if rank == 0:
+            empty += 1
+        else:
+            if prev == rank:
+                counter += 1
+            elif counter > 0:
+                merges += 1 + counter
+                counter = 0
+            prev = rank
+    if counter > 0:
+        merges += 1 + counter
+
+    mono_left = 0.0
+    mono_right = 0.0
+    for col in range(1, 4):
+        left = line[col - 1] ** HEUR_MONO_POWER
+        right = line[col] ** HEUR_MONO_POWER
+        if line[col - 1] > line[col]:
+            mono_left += left - right
+        else:
+            mono_right += right - left
+
+    return (HEUR_LOST_PENALTY + HEUR_EMPTY_WEIGHT * empty +
+            HEUR_MERGES_WEIGHT * merges -
+            HEUR_MONO_WEIGHT * min(mono_left, mono_right) -
+            HEUR_SUM_WEIGHT * total)
+
+def build_heuristic_table():
+    """
+    Fill the 65,536-entry row heuristic table used by the expectimax
+    player.  Only the first call does any work.
+    """
+    if len(ROW_HEURISTIC) > 0:
+        return
+    for row in range(ROW_MASK + 1):
+        ROW_HEURISTIC.append(score_row(row))
+
+def pack_game(game):
+    """
+    Return the packed bitboard for any 4x4 game object that provides
+    get_tile.
+    """
+    if hasattr(game, 'get_board'):
+        return game.get_board()
+    board = 0
+    for row in range(4):
+        for col in range(4):
+            board |= EXPONENTS[game.get_tile(row, col)] << (4 * (4 * row + col))
+    return board
+
+class ExpectimaxPlayer:
+    """
+    Expectimax search over packed 4x4 boards.  Max nodes try the
+    four directions and chance nodes average over the 2/4 spawns
+    made by new_tile.
+    """
+
+    def __init__(self, max_depth=3, prob_cutoff=0.0001):
+        build_row_tables()
+        build_heuristic_table()
+        self._max_depth = max_depth
+        self._prob_cutoff = prob_cutoff
+        self._nodes = 0
+        self._cache_lookups = 0
+        self._cache_hits = 0
+        self._elapsed = 0.0
+        self._cache = {}
+
+    def search_depth(self, board):
+        """
+        Return the search depth for a board: positions with few empty
+        cells have a small branching factor and need a deeper look.
+        """
+        empty = len(self.empty_cells(board))
+        if empty < 4:
+            depth = self._max_depth
+        elif empty < 8:
+            depth = self._max_depth - 1
+        else:
+            depth = self._max_depth - 2
+        return max(depth, 1)
+
+    def empty_cells(self, board):
+        """
+        Return the nibble indices of the empty cells of a packed board.
+        """
+        return [cell for cell in range(16) if (board >> (4 * cell)) & 0xF == 0]
+
+    def evaluate(self, board):
+        """
+        Heuristic value of a packed board from its rows and columns.
+        """
+        columns = transpose(board)
+        value = 0.0
+        for shift in (0, 16, 32, 48):
+            value += ROW_HEURISTIC[(board >> shift) & ROW_MASK]
+            value += ROW_HEURISTIC[(columns >> shift) & ROW_MASK]
+        return value
+
+    def max_node(self, board, depth, prob):
+        """
+        Value of the best move from a board, or 0 if no move is legal.
+        """
+        self._nodes += 1
+        best = 0.0
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            moved = bitboard_move(board, direction)
+            if moved != board:
+                best = max(best, self.chance_node(moved, depth, prob))
+        return best
+
+    def chance_node(self, board, depth, prob):
+        """
+        Expected value of a board over every possible tile spawn.
+        """
+        if depth <= 0 or prob < self._prob_cutoff:
+            return self.evaluate(board)
+
+        self._cache_lookups += 1
+        cached = self._cache.get(board)
+        if cached is not None and cached[0] >= depth:
+            self._cache_hits += 1
+            return cached[1]
+
+        self._nodes += 1
+        empty = self.empty_cells(board)
+        prob_each = prob / len(empty)
+        total = 0.0
+        for cell in empty:
+            shift = 4 * cell
+            total += 0.9 * self.max_node(board | (1 << shift), depth - 1,
+                                         prob_each * 0.9)
+            total += 0.1 * self.max_node(board | (2 << shift), depth - 1,
+                                         prob_each * 0.1)
+        value = total / len(empty)
+        self._cache[board] = (depth, value)
+        return value
+
+    def best_move(self, game):
+        """
+        Return the best direction to move in, or None if no move
+        changes the board.
+        """
+        start = time.time()
+        board = pack_game(game)
+        depth = self.search_depth(board)
+        self._cache = {}
+
+        best_value = -1.0
+        best_direction = None
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            moved = bitboard_move(board, direction)
+            if moved != board:
+                value = self.chance_node(moved, depth, 1.0)
+                if value > best_value:
+                    best_value = value
+                    best_direction = direction
+        self._elapsed += time.time() - start
+        return best_direction
+
+    def get_nodes(self):
+        """
+        Return the number of nodes searched so far.
+        """
+        return self._nodes
+
+    def get_nodes_per_sec(self):
+        """
+        Return the search speed over all calls to best_move.
+        """
+        if self._elapsed == 0:
+            return 0.0
+        return self._nodes / self._elapsed
+
+    def get_cache_hit_rate(self):
+        """
+        Return the fraction of transposition table lookups that hit.
+        """
+        if self._cache_lookups == 0:
+            return 0.0
+        return float(self._cache_hits) / self._cache_lookups
+
+def preview_move(game, direction):
+    """
+    Work out the result of a move without changing the game.
+    Returns a tuple (changed, score gained, empty cells after).
+    """
+    height = game.get_grid_height()
+    width = game.get_grid_width()
+    if direction == UP:
+        starts = [(0, col) for col in range(width)]
+        max_steps = height
+    elif direction == DOWN:
+        starts = [(height - 1, col) for col in range(width)]
+        max_steps = height
+    elif direction == LEFT:
+        starts = [(row, 0) for row in range(height)]
+        max_steps = width
+    else:
+        starts = [(row, width - 1) for row in range(height)]
+        max_steps = width
+
+    changed = False
+    score = 0
+    empty = 0
+    for initial in starts:
+        line = [game.get_tile(initial[0] + step * OFFSETS[direction][0],
+                              initial[1] + step * OFFSETS[direction][1])
+                for step in range(max_steps)]
+        merged, line_points = merge_and_score(line)
+        if merged != line:
+            changed = True
+        score += line_points
+        empty += len(list_zeroes(merged))
+    return changed, score, empty
+
+def policy_random(game, rng=random):
+    """
+    Pick any direction that changes the board.
+    """
+    legal = game.legal_moves()
+    if len(legal) == 0:
+        return None
+    return rng.choice(legal)
+
+def policy_greedy(game, rng=random):
+    """
+    Pick the direction that scores the most points right now,
+    breaking ties by the number of empty cells left.
+    """
+    best = None
+    best_value = None
+    for direction in (UP, DOWN, LEFT, RIGHT):
+        changed, score, empty = preview_move(game, direction)
+        if changed and (best_value is None or (score, empty) > best_value):
+            best = direction
+            best_value = (score, empty)
+    return best
+
+def policy_corner(game, rng=random):
+    """
+    Keep the big tiles in the top left corner by preferring UP and
+    LEFT, and only moving RIGHT or DOWN when forced to.
+    """
+    for direction in (UP, LEFT, RIGHT, DOWN):
+        if game.can_move(direction):
+            return direction
+    return None
+
+POLICIES = {'random': policy_random,
+            'greedy': policy_greedy,
+            'corner': policy_corner}
+
+def play_game(task):
+    """
+    Play one headless game until no move is possible.  Takes a tuple
+    (game number, policy name, grid height, grid width, seed) so it
+    can be mapped over a process pool, and returns a dictionary of
+    results.  The game only depends on the seed and game number.
+    """
+    game_num, policy_name, grid_height, grid_width, seed = task
+    policy = POLICIES[policy_name]
+    rng = SeedStream(seed).rng(game_num)
+    game = TwentyFortyEight(grid_height, grid_width, rng)
+    moves = 0
+
+    direction = policy(game, rng)
+    while direction is not None:
+        game.move(direction)
+        moves += 1
+        direction = policy(game, rng)
+
+    max_tile = max([game.get_tile(row, col)
+                    for row in range(grid_height)
+                    for col in range(grid_width)])
+    return {'game': game_num, 'policy': policy_name, 'seed': seed,
+            'score': game.get_score(), 'max_tile': max_tile, 'moves': moves}
+
+def run_batch(num_games, policy_name, grid_height, grid_width,
+              processes, out, seed=None, first_game=0):
+    """
+    Play num_games games across a process pool and write one JSON
+    line per game to out as soon as it finishes.  Games are numbered
+    from first_game, so a single game of a seeded batch can be
+    replayed with num_games=1.
+    """
+    import json
+    import multiprocessing
+
+    if seed is None:
+        seed = random.randrange(1 << 63)
+    tasks = [(game_num, policy_name, grid_height, grid_width, seed)
+             for game_num in range(first_game, first_game + num_games)]
+    if processes == 1:
+        results = (play_game(task) for task in tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(play_game, tasks)
+    for result in results:
+        out.write(json.dumps(result, sort_keys=True) + '\n')
+        out.flush()
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+# Rows used by the merge benchmarks: empty, already merged, sliding
+# only, single merges, double merges and a full row of equal tiles.
+BENCH_ROWS = [[0, 0, 0, 0],
+              [2, 4, 8, 16],
+              [0, 0, 0, 2],
+              [2, 0, 2, 4],
+              [4, 4, 8, 8],
+              [2, 2, 2, 2],
+              [0, 8, 8, 0, 16, 16, 0, 2]]
+BENCH_SEED = 2048
+
+def time_calls(func, min_time):
+    """
+    Call func() until at least min_time seconds have passed and
+    return a tuple (calls made, seconds taken).  Each call of func
+    may do any fixed number of operations.
+    """
+    import timeit
+
+    timer = timeit.default_timer
+    calls = 0
+    start = timer()
+    elapsed = 0.0
+    while elapsed < min_time:
+        func()
+        calls += 1
+        elapsed = timer() - start
+    return calls, elapsed
+
+def bench_line_function(func, min_time):
+    """
+    Return (operations, seconds) for func applied to BENCH_ROWS.
+    """
+    def run():
+        """
+        Apply func to every benchmark row once.
+        """
+        for row in BENCH_ROWS:
+            func(row)
+    calls, elapsed = time_calls(run, min_time)
+    return calls * len(BENCH_ROWS), elapsed
+
+def bench_moves(make_game, min_time):
+    """
+    Return (moves, seconds) for a seeded game that cycles through the
+    four directions and starts over whenever the game ends.
+    """
+    rng = random.Random(BENCH_SEED)
+    game = make_game(rng)
+
+    def run():
+        """
+        Make 100 moves.
+        """
+        for step in range(100):
+            game.move(step % 4 + 1)
+            if step % 4 == 3 and game.is_game_over():
+                game.reset()
+    calls, elapsed = time_calls(run, min_time)
+    return calls * 100, elapsed
+
+def bench_games(min_time):
+    """
+    Return (games, seconds, moves) for seeded 4x4 games played by
+    policy_random.
+    """
+    stream = SeedStream(BENCH_SEED)
+    state = {'games': 0, 'moves': 0}
+
+    def run():
+        """
+        Play one full game.
+        """
+        rng = stream.rng(state['games'])
+        game = TwentyFortyEight(4, 4, rng)
+        direction = policy_random(game, rng)
+        while direction is not None:
+            game.move(direction)
+            state['moves'] += 1
+            direction = policy_random(game, rng)
+        state['games'] += 1
+    calls, elapsed = time_calls(run, min_time)
+    return calls, elapsed, state['moves']
+
+def run_benchmarks(out, min_time=1.0):
+    """
+    Run the hot path benchmarks and write one JSON line per result,
+    with the rate in operations per second, to out.
+    """
+    import json
+    import platform
+
+    build_row_tables()
+    benchmarks = [
+        ('merge', 'merges', lambda: bench_line_function(merge, min_time)),
+        ('list_numbers', 'calls',
+         lambda: bench_line_function(list_numbers, min_time)),
+        ('list_zeroes', 'calls',
+         lambda: bench_line_function(list_zeroes, min_time)),
+        ('move_4x4', 'moves',
+         lambda: bench_moves(lambda rng: TwentyFortyEight(4, 4, rng),
+                             min_time)),
+        ('move_16x16', 'moves',
+         lambda: bench_moves(lambda rng: TwentyFortyEight(16, 16, rng),
+                             min_time)),
+        ('bitboard_move_4x4', 'moves',
+         lambda: bench_moves(lambda rng: BitboardTwentyFortyEight(4, 4, rng),
+                             min_time)),
+        ('random_games_4x4', 'games', lambda: bench_games(min_time))]
+
+    for name, unit, bench in benchmarks:
+        result = bench()
+        record = {'benchmark': name, 'unit': unit, 'ops': result[0],
+                  'seconds': round(result[1], 6),
+                  'ops_per_sec': round(result[0] / result[1], 1),
+                  'seed': BENCH_SEED,
+                  'python': platform.python_version()}
+        if len(result) > 2:
+            record['moves_per_sec'] = round(result[2] / result[1], 1)
+        out.write(json.dumps(record, sort_keys=True) + '\n')
+        out.flush()
+
+def main(argv):
+    """
+    Command line entry point for the headless batch runner and the
+    benchmark suite.
+    """
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Play headless 2048 games.')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random')
+    parser.add_argument('--height', type=int, default=4)
+    parser.add_argument('--width', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='batch seed (default: chosen at random)')
+    parser.add_argument('--first-game', type=int, default=0,
+                        help='number of the first game to play')
+    parser.add_argument('--bench', action='store_true',
+                        help='run the benchmark suite instead of playing')
+    parser.add_argument('--bench-time', type=float, default=1.0,
+                        help='minimum seconds per benchmark')
+    args = parser.parse_args(argv)
+    if args.bench:
+        run_benchmarks(sys.stdout, args.bench_time)
+        return
+    run_batch(args.games, args.policy, args.height, args.width,
+              args.processes, sys.stdout, args.seed, args.first_game)
 
-poc_2048_gui.run_gui(TwentyFortyEight(4, 4))
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1:
+        main(sys.argv[1:])
+    else:
+        import poc_2048_gui
+        poc_2048_gui.run_gui(TwentyFortyEight(4, 4))
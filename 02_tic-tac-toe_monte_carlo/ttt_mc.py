@@ -2,7 +2,9 @@
 Monte Carlo Tic-Tac-Toe Player
 """
 
+import math
 import random
+import time
 import poc_ttt_gui
 import poc_ttt_provided as provided
 
@@ -14,7 +16,7 @@ SCORE_CURRENT = 1.0 # Score for squares played by the current player
 SCORE_OTHER = 1.0   # Score for squares played by the other player
 
 
-def mc_trial(board, player):
+def mc_trial(board, player, rng=random):
     """
     Takes a board and computer player as input, then plays through
     a trial game which is then scored by mc_update_scores to
@@ -25,7 +27,7 @@ def mc_trial(board, player):
     winner = None
 
     while winner == None:
-        move = random.choice(empty)
+        move = rng.choice(empty)
         board.move(move[0], move[1], curplayer)
         winner = board.check_win()
         curplayer = provided.switch_player(curplayer)
@@ -71,7 +73,7 @@ def get_scoring_squares(board, player):
     return current, other
 
 
-def get_best_move(board, scores):
+def get_best_move(board, scores, rng=random):
     """
     Creates a list of top scoring moves for the computer player and
     return a randomly selected one from that list.
@@ -85,7 +87,7 @@ def get_best_move(board, scores):
     for score in empty:
         if scores[score[0]][score[1]] == highest_score:
             best_moves.append((score[0],score[1]))
-    return random.choice(best_moves)
+    return rng.choice(best_moves)
 
 
 def mc_move(board, player, trials):
@@ -104,6 +106,799 @@ def mc_move(board, player, trials):
     return get_best_move(board, scores)
 
 
+def mc_trial_scores(task):
+    """
+    Runs a share of the trials for mc_move_parallel.  Takes a tuple
+    (board, player, trials, seed) so it can be mapped over a process
+    pool, and returns the score grid for just those trials.  The
+    trials are played on one reused PlayoutBoard.
+    """
+    board, player, trials, seed = task
+    rng = random.Random(seed)
+    reverse = board_reverse(board)
+    root = PlayoutBoard(board, reverse)
+    trial_board = PlayoutBoard(board, reverse)
+    scores = [[0 for dummycol in range(board.get_dim())]
+              for dummyrow in range(board.get_dim())]
+    for dummy_trial in range(trials):
+        trial_board.copy_from(root)
+        trial_board.playout(player, rng)
+        trial_board.update_scores(scores, player)
+    return scores
+
+
+# Worker pools kept by mc_move_parallel, keyed by number of processes
+POOLS = {}
+
+
+def get_pool(processes):
+    """
+    Returns a pool of worker processes of the given size, starting it
+    on first use and keeping it for later moves.
+    """
+    import multiprocessing
+
+    if processes not in POOLS:
+        POOLS[processes] = multiprocessing.Pool(processes)
+    return POOLS[processes]
+
+
+def close_pools():
+    """
+    Shuts down every pool started by get_pool.
+    """
+    for pool in POOLS.values():
+        pool.close()
+        pool.join()
+    POOLS.clear()
+
+
+def mc_move_parallel(board, player, trials, processes=None, seeds=None,
+                     pool=None):
+    """
+    Same as mc_move, but splits the trials into one share per seed
+    and runs the shares across a pool of worker processes.  The pool
+    is the one passed in, if any, or a long-lived one from get_pool,
+    so workers are only started once per game rather than per move.
+    The result only depends on the seeds, so processes=1 runs the
+    same trials serially and returns the same move.
+    """
+    import multiprocessing
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if seeds is None:
+        seeds = [random.randrange(1 << 31) for dummy in range(processes)]
+
+    tasks = []
+    for index in range(len(seeds)):
+        share = trials // len(seeds)
+        if index < trials % len(seeds):
+            share += 1
+        tasks.append((board, player, share, seeds[index]))
+
+    if pool is None and processes == 1:
+        results = [mc_trial_scores(task) for task in tasks]
+    else:
+        if pool is None:
+            pool = get_pool(processes)
+        results = pool.map(mc_trial_scores, tasks)
+
+    dim = board.get_dim()
+    scores = [[0 for dummycol in range(dim)] for dummyrow in range(dim)]
+    for result in results:
+        for row in range(dim):
+            for col in range(dim):
+                scores[row][col] += result[row][col]
+    return get_best_move(board, scores, random.Random(sum(seeds)))
+
+
+def board_lines(dim):
+    """
+    Returns every winning line of a dim x dim board (rows, columns
+    and both diagonals) as a tuple of flat square indices.
+    """
+    lines = []
+    for row in range(dim):
+        lines.append(tuple([row * dim + col for col in range(dim)]))
+    for col in range(dim):
+        lines.append(tuple([row * dim + col for row in range(dim)]))
+    lines.append(tuple([idx * dim + idx for idx in range(dim)]))
+    lines.append(tuple([idx * dim + dim - idx - 1 for idx in range(dim)]))
+    return lines
+
+
+def board_reverse(board):
+    """
+    Returns True if the board is played with the reverse rule (three
+    in a row loses), found by completing a line on a clone of the
+    board.  Returns False if no player can complete any line, as the
+    rule does not matter then.
+    """
+    dim = board.get_dim()
+    for line in board_lines(dim):
+        marks = set([board.square(square // dim, square % dim)
+                     for square in line])
+        marks.discard(provided.EMPTY)
+        if len(marks) <= 1:
+            player = provided.PLAYERX
+            if marks:
+                player = marks.pop()
+            probe = board.clone()
+            for square in line:
+                probe.move(square // dim, square % dim, player)
+            return probe.check_win() != player
+    return False
+
+
+class PlayoutBoard:
+    """
+    Compact board for fast random playouts.  Squares live in a flat
+    bytearray, the empty squares in a list that shrinks by swapping
+    the chosen square to the end, and wins are found by counting each
+    player's marks in only the lines through the last move.  Wins
+    follow the board's own rule unless reverse is given.
+    """
+
+    def __init__(self, board, reverse=None):
+        dim = board.get_dim()
+        if reverse is None:
+            reverse = board_reverse(board)
+        self._dim = dim
+        self._reverse = reverse
+        self._lines = board_lines(dim)
+        self._lines_through = [[] for dummy in range(dim * dim)]
+        for line in range(len(self._lines)):
+            for square in self._lines[line]:
+                self._lines_through[square].append(line)
+
+        self._squares = bytearray(dim * dim)
+        self._empty = []
+        self._counts = {provided.PLAYERX: [0] * len(self._lines),
+                        provided.PLAYERO: [0] * len(self._lines)}
+        for row in range(dim):
+            for col in range(dim):
+                square = row * dim + col
+                self._squares[square] = board.square(row, col)
+                if board.square(row, col) == provided.EMPTY:
+                    self._empty.append(square)
+                else:
+                    for line in self._lines_through[square]:
+                        self._counts[board.square(row, col)][line] += 1
+        self._num_empty = len(self._empty)
+        self._winner = board.check_win()
+
+    def copy_from(self, other):
+        """
+        Overwrite this board with the position on another board of
+        the same size without allocating anything.
+        """
+        self._squares[:] = other._squares
+        self._empty[:] = other._empty
+        self._num_empty = other._num_empty
+        self._counts[provided.PLAYERX][:] = other._counts[provided.PLAYERX]
+        self._counts[provided.PLAYERO][:] = other._counts[provided.PLAYERO]
+        self._winner = other._winner
+
+    def clone(self):
+        """
+        Return a copy of the board.
+        """
+        board = PlayoutBoard(self, self._reverse)
+        return board
+
+    def get_dim(self):
+        """
+        Return the dimension of the board.
+        """
+        return self._dim
+
+    def square(self, row, col):
+        """
+        Return the player in the given square.
+        """
+        return self._squares[row * self._dim + col]
+
+    def get_empty_squares(self):
+        """
+        Return a list of (row, col) tuples for all empty squares.
+        """
+        return [divmod(square, self._dim)
+                for square in self._empty[:self._num_empty]]
+
+    def check_win(self):
+        """
+        Return the winner, DRAW, or None if the game is in progress.
+        """
+        return self._winner
+
+    def move(self, row, col, player):
+        """
+        Place player on the given square if it is empty.
+        """
+        square = row * self._dim + col
+        if self._squares[square] != provided.EMPTY:
+            return
+        self.place(self._empty.index(square, 0, self._num_empty), player)
+
+    def place(self, position, player):
+        """
+        Place player on the square at the given position of the empty
+        list, then update the line counts through that square.
+        """
+        last = self._num_empty - 1
+        square = self._empty[position]
+        self._empty[position] = self._empty[last]
+        self._empty[last] = square
+        self._num_empty = last
+        self._squares[square] = player
+
+        counts = self._counts[player]
+        for line in self._lines_through[square]:
+            counts[line] += 1
+            if counts[line] == self._dim:
+                if self._reverse:
+                    self._winner = provided.switch_player(player)
+                else:
+                    self._winner = player
+                return
+        if last == 0:
+            self._winner = provided.DRAW
+
+    def playout(self, player, rng=random):
+        """
+        Play random moves, starting with player, until the game ends.
+        """
+        while self._winner is None:
+            self.place(rng.randrange(self._num_empty), player)
+            player = provided.switch_player(player)
+
+    def update_scores(self, scores, player, squares=None):
+        """
+        Same as mc_update_scores, but reads the flat squares directly.
+        If given, squares accumulates the squared score changes.
+        """
+        other_player = provided.switch_player(player)
+        if self._winner == player:
+            current, other = SCORE_CURRENT, -SCORE_OTHER
+        elif self._winner == other_player:
+            current, other = -SCORE_CURRENT, SCORE_OTHER
+        else:
+            return
+        dim = self._dim
+        for square in range(dim * dim):
+            if self._squares[square] == player:
+                scores[square // dim][square % dim] += current
+                if squares is not None:
+                    squares[square // dim][square % dim] += current * current
+            elif self._squares[square] == other_player:
+                scores[square // dim][square % dim] += other
+                if squares is not None:
+                    squares[square // dim][square % dim] += other * other
+
+
+def mc_move_playout(board, player, trials, reverse=None):
+    """
+    Same as mc_move, but runs the trials on a PlayoutBoard.  It takes
+    the same arguments, so it can be passed to play_game or run_gui
+    in place of mc_move.  The board's own win rule is used unless
+    reverse is given.
+    """
+    root = PlayoutBoard(board, reverse)
+    trial_board = PlayoutBoard(board, reverse)
+    scores = [[0 for dummycol in range(board.get_dim())]
+              for dummyrow in range(board.get_dim())]
+    for dummy_trial in range(trials):
+        trial_board.copy_from(root)
+        trial_board.playout(player)
+        trial_board.update_scores(scores, player)
+    return get_best_move(board, scores)
+
+
+def mc_batch_playouts(board, player, trials, rng=random, reverse=None):
+    """
+    Generates the trials for mc_batch_scores.  Each trial is a random
+    ordering of the empty squares, played alternately starting with
+    player, so the winner can be read off from the step at which each
+    line fills up rather than by replaying the game.  This is a plain
+    loop over the trials; mc_batch_arrays does the same with NumPy.  Returns a list of
+    (order, last step, winner) tuples; squares after the last step
+    were never played.  The board's own win rule is used unless
+    reverse is given.
+    """
+    if reverse is None:
+        reverse = board_reverse(board)
+    dim = board.get_dim()
+    other_player = provided.switch_player(player)
+    empty = [row * dim + col for (row, col) in board.get_empty_squares()]
+
+    # Only lines that one player can still complete matter.  For each
+    # one keep its owner, if already decided, and its empty squares.
+    live_lines = []
+    for line in board_lines(dim):
+        owners = set([board.square(square // dim, square % dim)
+                      for square in line]) - set([provided.EMPTY])
+        if len(owners) < 2:
+            squares = [square for square in line
+                       if board.square(square // dim, square % dim) ==
+                       provided.EMPTY]
+            live_lines.append((owners.pop() if owners else None, squares))
+
+    playouts = []
+    step_of = [0] * (dim * dim)
+    for dummy_trial in range(trials):
+        order = empty[:]
+        rng.shuffle(order)
+        for step in range(len(order)):
+            step_of[order[step]] = step
+
+        last_step = len(order) - 1
+        winner = provided.DRAW
+        for owner, squares in live_lines:
+            parity = step_of[squares[0]] % 2
+            if owner is not None and owner != (player, other_player)[parity]:
+                continue
+            done = step_of[squares[0]]
+            for square in squares:
+                if step_of[square] % 2 != parity:
+                    break
+                done = max(done, step_of[square])
+            else:
+                if done < last_step or winner == provided.DRAW:
+                    last_step = done
+                    winner = (player, other_player)[parity]
+        if winner != provided.DRAW and reverse:
+            winner = provided.switch_player(winner)
+        playouts.append((order, last_step, winner))
+    return playouts
+
+
+def mc_batch_scores(board, player, playouts):
+    """
+    Scores a batch of playouts from mc_batch_playouts.  Counts the
+    net wins for each square and player as integers, then applies
+    SCORE_CURRENT and SCORE_OTHER once at the end.
+    """
+    dim = board.get_dim()
+    other_player = provided.switch_player(player)
+    net_current = [0] * (dim * dim)
+    net_other = [0] * (dim * dim)
+    net_total = 0
+    for order, last_step, winner in playouts:
+        if winner == player:
+            result = 1
+        elif winner == other_player:
+            result = -1
+        else:
+            continue
+        net_total += result
+        for step in range(0, last_step + 1, 2):
+            net_current[order[step]] += result
+        for step in range(1, last_step + 1, 2):
+            net_other[order[step]] += result
+    return batch_score_grid(board, player, net_current, net_other, net_total)
+
+
+def batch_score_grid(board, player, net_current, net_other, net_total):
+    """
+    Turns the net win counts of a batch into a score grid.  Squares
+    already on the board count for every trial.
+    """
+    dim = board.get_dim()
+    other_player = provided.switch_player(player)
+    scores = [[0 for dummycol in range(dim)] for dummyrow in range(dim)]
+    for row in range(dim):
+        for col in range(dim):
+            square = row * dim + col
+            if board.square(row, col) == player:
+                net_current[square] += net_total
+            elif board.square(row, col) == other_player:
+                net_other[square] += net_total
+            scores[row][col] = (SCORE_CURRENT * net_current[square] -
+                                SCORE_OTHER * net_other[square])
+    return scores
+
+
+def mc_batch_arrays(board, player, trials, rng=random, reverse=None):
+    """
+    Same as mc_batch_scores(board, player, mc_batch_playouts(...)),
+    but with NumPy: the trials are a (trials, empty squares) array of
+    permutations and every line is checked for all trials at once.
+    The NumPy generator is seeded from rng.
+    """
+    import numpy
+
+    if reverse is None:
+        reverse = board_reverse(board)
+    dim = board.get_dim()
+    other_player = provided.switch_player(player)
+    empty = numpy.array([row * dim + col
+                         for (row, col) in board.get_empty_squares()])
+    num_empty = len(empty)
+    generator = numpy.random.default_rng(rng.getrandbits(64))
+
+    orders = numpy.argsort(generator.random((trials, num_empty)), axis=1)
+    squares_played = empty[orders]
+    steps = numpy.arange(num_empty)
+    step_of = numpy.zeros((trials, dim * dim), numpy.int64)
+    numpy.put_along_axis(step_of, squares_played,
+                         numpy.broadcast_to(steps, orders.shape), axis=1)
+
+    # The first line to fill up with one player's squares wins.
+    first_done = numpy.full(trials, num_empty)
+    parity = numpy.zeros(trials, numpy.int64)
+    for line in board_lines(dim):
+        owners = set([board.square(square // dim, square % dim)
+                      for square in line]) - set([provided.EMPTY])
+        squares = [square for square in line
+                   if board.square(square // dim, square % dim) ==
+                   provided.EMPTY]
+        if len(owners) > 1 or not squares:
+            continue
+        line_steps = step_of[:, squares]
+        line_parity = line_steps[:, 0] % 2
+        done = line_steps.max(axis=1)
+        complete = (line_steps % 2 == line_parity[:, None]).all(axis=1)
+        if owners:
+            complete &= line_parity == (0 if owners.pop() == player else 1)
+        better = complete & (done < first_done)
+        first_done[better] = done[better]
+        parity[better] = line_parity[better]
+
+    won = first_done < num_empty
+    result = numpy.where(won, 1 - 2 * parity, 0)
+    if reverse:
+        result = -result
+    last_step = numpy.where(won, first_done, num_empty - 1)
+    played = steps[None, :] <= last_step[:, None]
+    weights = result[:, None] * played
+    net_current = numpy.bincount(
+        squares_played[:, 0::2].ravel(), weights[:, 0::2].ravel(), dim * dim)
+    net_other = numpy.bincount(
+        squares_played[:, 1::2].ravel(), weights[:, 1::2].ravel(), dim * dim)
+    return batch_score_grid(board, player,
+                            [int(net) for net in net_current],
+                            [int(net) for net in net_other],
+                            int(result.sum()))
+
+
+def mc_move_batch(board, player, trials, reverse=None, use_numpy=None):
+    """
+    Same as mc_move, but generates and scores all of the trials in
+    one batch.  Uses mc_batch_arrays when NumPy can be imported (and
+    use_numpy is not False), otherwise the list version.  The board's
+    own win rule is used unless reverse is given.
+    """
+    if use_numpy is not False:
+        try:
+            import numpy
+            return get_best_move(board, mc_batch_arrays(board, player, trials,
+                                                        random, reverse))
+        except ImportError:
+            if use_numpy:
+                raise
+    playouts = mc_batch_playouts(board, player, trials, random, reverse)
+    return get_best_move(board, mc_batch_scores(board, player, playouts))
+
+
+def is_decisive(board, scores, squares, trials, confidence):
+    """
+    Returns True if the best empty square's mean score beats the
+    second best by more than confidence standard errors.
+    """
+    stats = []
+    for (row, col) in board.get_empty_squares():
+        mean = float(scores[row][col]) / trials
+        variance = max(float(squares[row][col]) / trials - mean * mean, 0.0)
+        stats.append((mean, variance))
+    if len(stats) < 2:
+        return True
+    stats.sort(reverse=True)
+    error = math.sqrt((stats[0][1] + stats[1][1]) / trials)
+    return stats[0][0] - stats[1][0] > confidence * error
+
+
+def mc_move_anytime(board, player, budget, reverse=None, min_trials=100,
+                    confidence=3.0, batch=50):
+    """
+    Runs trials until budget seconds have passed, or until the best
+    square is clearly ahead after at least min_trials trials, and
+    returns a tuple (best move so far, number of trials run).  The
+    board's own win rule is used unless reverse is given.
+    """
+    deadline = time.time() + budget
+    root = PlayoutBoard(board, reverse)
+    trial_board = PlayoutBoard(board, reverse)
+    dim = board.get_dim()
+    scores = [[0 for dummycol in range(dim)] for dummyrow in range(dim)]
+    squares = [[0 for dummycol in range(dim)] for dummyrow in range(dim)]
+
+    trials = 0
+    while True:
+        for dummy_trial in range(batch):
+            trial_board.copy_from(root)
+            trial_board.playout(player)
+            trial_board.update_scores(scores, player, squares)
+        trials += batch
+        if time.time() >= deadline:
+            break
+        if (trials >= min_trials and
+                is_decisive(board, scores, squares, trials, confidence)):
+            break
+    return get_best_move(board, scores), trials
+
+
+def mc_move_racing(board, player, trials, reverse=None, confidence=3.0,
+                   batch=None, stats=None):
+    """
+    Races the empty squares against each other.  Each round plays
+    batch trials for every square still in the race, each starting
+    with player taking that square, and scores them all into one grid
+    the same way mc_update_scores does.  Squares whose mean score
+    per trial is confidence standard errors below the leader's are
+    dropped.  Stops once one square is left or trials have been used,
+    and returns the best remaining square as picked by get_best_move.
+    The board's own win rule is used unless reverse is given.
+
+    If stats is a dictionary it is filled in with the trials used, the
+    number of squares left after each round and each square's mean
+    score.
+    """
+    dim = board.get_dim()
+    empty = board.get_empty_squares()
+    if batch is None:
+        batch = max(trials // (4 * len(empty)), 1)
+    root = PlayoutBoard(board, reverse)
+    trial_board = PlayoutBoard(board, reverse)
+    other_player = provided.switch_player(player)
+    scores = [[0 for dummycol in range(dim)] for dummyrow in range(dim)]
+    squares = [[0 for dummycol in range(dim)] for dummyrow in range(dim)]
+
+    racing = list(empty)
+    survivors = []
+    used = 0
+    while len(racing) > 1 and used < trials:
+        for move in racing:
+            for dummy_trial in range(min(batch, trials - used)):
+                trial_board.copy_from(root)
+                trial_board.move(move[0], move[1], player)
+                trial_board.playout(other_player)
+                trial_board.update_scores(scores, player, squares)
+                used += 1
+
+        bounds = {}
+        for move in racing:
+            mean = float(scores[move[0]][move[1]]) / used
+            variance = max(float(squares[move[0]][move[1]]) / used -
+                           mean * mean, 0.0)
+            error = confidence * math.sqrt(variance / used)
+            bounds[move] = (mean - error, mean + error)
+        best_lower = max([bounds[move][0] for move in racing])
+        racing = [move for move in racing if bounds[move][1] >= best_lower]
+        survivors.append(len(racing))
+
+    racing_scores = [[float('-inf') for dummycol in range(dim)]
+                     for dummyrow in range(dim)]
+    for move in racing:
+        racing_scores[move[0]][move[1]] = scores[move[0]][move[1]]
+    if stats is not None:
+        stats['trials'] = used
+        stats['survivors'] = survivors
+        stats['means'] = dict([(move, float(scores[move[0]][move[1]]) / max(used, 1))
+                               for move in empty])
+    return get_best_move(board, racing_scores)
+
+
+class UCTPlayer:
+    """
+    Monte Carlo Tree Search player using the UCT selection rule.
+    Instances take the same (board, player, trials) arguments as
+    mc_move, so they can be passed to play_game or run_gui, and the
+    tree is kept between calls when the new board follows on from the
+    last one.
+
+    Nodes are stored in parallel lists rather than objects, and the
+    children of a node always occupy one contiguous block.  Each board
+    is played with its own win rule unless reverse is given, and the
+    tree is thrown away when the rule changes.
+    """
+
+    def __init__(self, exploration=1.4, reverse=None):
+        self._exploration = exploration
+        self._reverse = reverse
+        self._tree_reverse = None
+        self._playouts = 0
+        self._elapsed = 0.0
+        self._root_board = None
+        self.clear()
+
+    def clear(self):
+        """
+        Throw away the search tree.
+        """
+        self._parent = []
+        self._square = []
+        self._mover = []
+        self._first_child = []
+        self._num_children = []
+        self._visits = []
+        self._wins = []
+        self._root_board = None
+
+    def add_node(self, parent, square, mover):
+        """
+        Append a node and return its index.
+        """
+        self._parent.append(parent)
+        self._square.append(square)
+        self._mover.append(mover)
+        self._first_child.append(-1)
+        self._num_children.append(0)
+        self._visits.append(0)
+        self._wins.append(0.0)
+        return len(self._parent) - 1
+
+    def get_tree_size(self):
+        """
+        Return the number of nodes in the tree.
+        """
+        return len(self._parent)
+
+    def get_playouts_per_sec(self):
+        """
+        Return the search speed over all calls so far.
+        """
+        if self._elapsed == 0:
+            return 0.0
+        return self._playouts / self._elapsed
+
+    def find_root(self, board, player):
+        """
+        Return the node for board if it follows on from the old root
+        by one move of each player, or None.
+        """
+        if self._root_board is None or board.get_dim() != self._root_board.get_dim():
+            return None
+        dim = board.get_dim()
+        first = provided.switch_player(self._mover[0])
+        moves = {first: [], provided.switch_player(first): []}
+        for row in range(dim):
+            for col in range(dim):
+                old = self._root_board.square(row, col)
+                new = board.square(row, col)
+                if old != new:
+                    if old != provided.EMPTY or new not in moves:
+                        return None
+                    moves[new].append(row * dim + col)
+        if (len(moves[first]) != 1 or
+                len(moves[provided.switch_player(first)]) != 1 or
+                first != player):
+            return None
+
+        node = 0
+        for mover in (first, provided.switch_player(first)):
+            for child in range(self._first_child[node],
+                               self._first_child[node] + self._num_children[node]):
+                if self._square[child] == moves[mover][0]:
+                    node = child
+                    break
+            else:
+                return None
+        return node
+
+    def reroot(self, root):
+        """
+        Keep only the subtree under root, copied into fresh lists with
+        root at index 0.
+        """
+        order = [root]
+        first_child = [-1]
+        position = 0
+        while position < len(order):
+            old = order[position]
+            if self._num_children[old] > 0:
+                first_child[position] = len(order)
+                for child in range(self._first_child[old],
+                                   self._first_child[old] +
+                                   self._num_children[old]):
+                    order.append(child)
+                    first_child.append(-1)
+            position += 1
+
+        new_index = dict([(order[index], index) for index in range(len(order))])
+        self._parent = [new_index.get(self._parent[old], -1) for old in order]
+        self._parent[0] = -1
+        self._square = [self._square[old] for old in order]
+        self._mover = [self._mover[old] for old in order]
+        self._first_child = first_child
+        self._num_children = [self._num_children[old] for old in order]
+        self._visits = [self._visits[old] for old in order]
+        self._wins = [self._wins[old] for old in order]
+
+    def select_child(self, node):
+        """
+        Return the child of node with the highest UCB1 value, trying
+        every child once first.
+        """
+        log_visits = math.log(self._visits[node])
+        best_child = -1
+        best_value = -1.0
+        for child in range(self._first_child[node],
+                           self._first_child[node] + self._num_children[node]):
+            visits = self._visits[child]
+            if visits == 0:
+                return child
+            value = (self._wins[child] / visits + self._exploration *
+                     math.sqrt(log_visits / visits))
+            if value > best_value:
+                best_value = value
+                best_child = child
+        return best_child
+
+    def __call__(self, board, player, trials):
+        """
+        Run trials playouts from board with player to move and return
+        the most visited move.
+        """
+        start = time.time()
+        reverse = self._reverse
+        if reverse is None:
+            reverse = board_reverse(board)
+        if reverse != self._tree_reverse:
+            self.clear()
+            self._tree_reverse = reverse
+        root = self.find_root(board, player)
+        if root is None:
+            self.clear()
+            self.add_node(-1, -1, provided.switch_player(player))
+        else:
+            self.reroot(root)
+        self._root_board = PlayoutBoard(board, reverse)
+        scratch = PlayoutBoard(board, reverse)
+        dim = board.get_dim()
+
+        for dummy_trial in range(trials):
+            scratch.copy_from(self._root_board)
+            node = 0
+            to_move = player
+            while self._num_children[node] > 0:
+                node = self.select_child(node)
+                scratch.move(self._square[node] // dim, self._square[node] % dim,
+                             to_move)
+                to_move = provided.switch_player(to_move)
+
+            if scratch.check_win() is None and (node == 0 or self._visits[node] > 0):
+                empty = [row * dim + col
+                         for (row, col) in scratch.get_empty_squares()]
+                self._first_child[node] = len(self._parent)
+                self._num_children[node] = len(empty)
+                for square in empty:
+                    self.add_node(node, square, to_move)
+                node = self._first_child[node]
+                scratch.move(self._square[node] // dim, self._square[node] % dim,
+                             to_move)
+                to_move = provided.switch_player(to_move)
+
+            scratch.playout(to_move)
+            winner = scratch.check_win()
+            while node != -1:
+                self._visits[node] += 1
+                if winner == self._mover[node]:
+                    self._wins[node] += 1.0
+                elif winner == provided.DRAW:
+                    self._wins[node] += 0.5
+                node = self._parent[node]
+
+        self._playouts += trials
+        self._elapsed += time.time() - start
+        best_child = -1
+        for child in range(self._first_child[0],
+                           self._first_child[0] + self._num_children[0]):
+            if best_child == -1 or self._visits[child] > self._visits[best_child]:
+                best_child = child
+        return divmod(self._square[best_child], dim)
+
+
 # Test game with the console or the GUI.  Uncomment whichever 
 # you prefer.  Both should be commented out when you submit
 # for testing to save time.
@@ -1,9 +1,12 @@
 """
 Cookie Clicker Simulator
 """
+import bisect
+import heapq
 import math
 import simpleplot
 import random
+import time
 # Used to increase the timeout, if necessary
 import codeskulptor
 codeskulptor.set_timeout(20)
@@ -14,17 +17,162 @@ import poc_clicker_provided as provided
 SIM_TIME = 10000000000.0
 #SIM_TIME = 1000.0
 
+class PurchaseHistory:
+    """
+    Compact purchase history stored in typed arrays instead of a list
+    of tuples.  Keeps every purchase by default; with every > 1 only
+    every n-th purchase is kept, and with ring=True only the latest
+    capacity entries are kept.  Entries read back as the same
+    (time, item, cost of item, total cookies) tuples as a list history.
+    """
+
+    def __init__(self, capacity=1024, every=1, ring=False):
+        from array import array
+
+        if capacity < 1:
+            raise ValueError("history capacity must be at least 1")
+        if every < 1:
+            raise ValueError("history every must be at least 1")
+        self._capacity = capacity
+        self._every = every
+        self._ring = ring
+        self._times = array('d', [0.0]) * capacity
+        self._items = array('i', [0]) * capacity
+        self._costs = array('d', [0.0]) * capacity
+        self._totals = array('d', [0.0]) * capacity
+        self._start = 0
+        self._length = 0
+        self._purchases = 0
+        # Item names by id; id 0 is the initial entry with no item.
+        self._names = [None]
+        self._ids = {None: 0}
+        self._view = HistoryView(self)
+        self._store(0.0, None, 0.0, 0.0)
+
+    def __str__(self):
+        """
+        Return a summary with only the first and last few entries
+        """
+        length = len(self)
+        if length <= 6:
+            entries = str(list(self))
+        else:
+            entries = (str([self[index] for index in range(3)])[:-1] +
+                       ", ..., " +
+                       str([self[index] for index in range(-3, 0)])[1:])
+        return ("PurchaseHistory(" + str(length) + " of " +
+                str(self._purchases + 1) + " entries kept): " + entries)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position]
+                    for position in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if index < 0 or index >= self._length:
+            raise IndexError("history index out of range")
+        slot = (self._start + index) % self._capacity
+        return (self._times[slot], self._names[self._items[slot]],
+                self._costs[slot], self._totals[slot])
+
+    def _store(self, time, item, cost, total):
+        """
+        Write an entry into the next free slot, growing the arrays or
+        overwriting the oldest entry when full.
+        """
+        if self._length == self._capacity:
+            if self._ring:
+                self._start = (self._start + 1) % self._capacity
+                self._length -= 1
+            else:
+                self._times.extend(self._times)
+                self._items.extend(self._items)
+                self._costs.extend(self._costs)
+                self._totals.extend(self._totals)
+                self._capacity *= 2
+        if item not in self._ids:
+            self._ids[item] = len(self._names)
+            self._names.append(item)
+        slot = (self._start + self._length) % self._capacity
+        self._times[slot] = time
+        self._items[slot] = self._ids[item]
+        self._costs[slot] = cost
+        self._totals[slot] = total
+        self._length += 1
+
+    def append(self, entry):
+        """
+        Record a (time, item, cost of item, total cookies) purchase
+        """
+        self._purchases += 1
+        if self._purchases % self._every == 0:
+            self._store(*entry)
+
+    def get_purchases(self):
+        """
+        Return the number of purchases recorded, kept or not
+        """
+        return self._purchases
+
+    def view(self):
+        """
+        Return a read-only view of the history
+        """
+        return self._view
+
+
+class HistoryView:
+    """
+    Read-only view of a PurchaseHistory, handed to strategies so they
+    can look at the history without copying it.
+    """
+
+    def __init__(self, history):
+        self._history = history
+
+    def __str__(self):
+        return str(self._history)
+
+    def __len__(self):
+        return len(self._history)
+
+    def __iter__(self):
+        return iter(self._history)
+
+    def __getitem__(self, index):
+        return self._history[index]
+
+    def get_purchases(self):
+        """
+        Return the number of purchases recorded, kept or not
+        """
+        return self._history.get_purchases()
+
+
 class ClickerState:
     """
     Simple class to keep track of the game state.
+
+    Pass a PurchaseHistory to keep a bounded history in typed arrays
+    instead of the default list of tuples.
     """
 
-    def __init__(self):
+    def __init__(self, history=None):
         self._total_cookies = 0.0
         self._current_cookies = 0.0
         self._time = 0.0
         self._cps = 1.0
-        self._history = [(0.0, None, 0.0, 0.0)]
+        if history is None:
+            self._history = [(0.0, None, 0.0, 0.0)]
+        else:
+            self._history = history
 
     def __str__(self):
         """
@@ -49,6 +197,14 @@ class ClickerState:
         """
         return self._current_cookies
 
+    def get_total_cookies(self):
+        """
+        Return total number of cookies produced so far
+
+        Should return a float
+        """
+        return self._total_cookies
+
     def get_cps(self):
         """
         Get current CPS
@@ -76,7 +232,10 @@ class ClickerState:
 
         Should return a copy of any internal data structures,
         so that they will not be modified outside of the class.
+        A PurchaseHistory is returned as a read-only HistoryView.
         """
+        if isinstance(self._history, PurchaseHistory):
+            return self._history.view()
         return self._history
 
     def time_until(self, cookies):
@@ -116,15 +275,154 @@ class ClickerState:
             self._history.append((self._time, item_name, cost, self._total_cookies))
 
 
-def simulate_clicker(build_info, duration, strategy):
+class BuildIndex:
+    """
+    BuildInfo wrapper that keeps the items indexed by cost and by CPS
+    to cost ratio, so strategies can find the cheapest, most expensive
+    or best ratio item they can afford without looking at every item.
+    Costs may only change through update_item.  Ties between equal
+    costs or ratios go to the first item in name order.
+
+    The heaps make the cheapest item query and heap updates O(log n)
+    (amortised over stale entries), and the best ratio query O(k log n)
+    for k better ratio items that cost too much.  The most expensive
+    item query is an O(log n) bisection of a sorted list, but keeping
+    that list sorted makes update_item O(n) overall: each update
+    shifts part of the list, though without any Python level loop.
+    """
+
+    def __init__(self, build_info):
+        if isinstance(build_info, BuildIndex):
+            build_info = build_info._build_info
+        self._build_info = build_info
+        self._names = sorted(build_info.build_items())
+        self._ranks = dict((item, rank) for rank, item in enumerate(self._names))
+        # Heap entries are (key, rank, version); an entry is stale once
+        # its item's version has moved on.
+        self._versions = [0] * len(self._names)
+        self._by_cost = []
+        self._by_ratio = []
+        # (cost, -rank) for every item, in order.
+        self._sorted = []
+        for rank, item in enumerate(self._names):
+            cost_entry, ratio_entry = self._entries(rank)
+            self._by_cost.append(cost_entry)
+            self._by_ratio.append(ratio_entry)
+            self._sorted.append((build_info.get_cost(item), -rank))
+        heapq.heapify(self._by_cost)
+        heapq.heapify(self._by_ratio)
+        self._sorted.sort()
+
+    def _entries(self, rank):
+        """
+        Return the cost and ratio heap entries for the item's current
+        cost.
+        """
+        item = self._names[rank]
+        cost = self._build_info.get_cost(item)
+        version = self._versions[rank]
+        return ((cost, rank, version),
+                (-self._build_info.get_cps(item) / cost, rank, version))
+
+    def _top(self, heap):
+        """
+        Drop stale entries from the heap and return the top one,
+        or None if the heap is empty.
+        """
+        while len(heap) > 0 and heap[0][2] != self._versions[heap[0][1]]:
+            heapq.heappop(heap)
+        if len(heap) == 0:
+            return None
+        return heap[0]
+
+    def build_items(self):
+        """
+        Get a list of buildable items
+        """
+        return self._build_info.build_items()
+
+    def get_cost(self, item):
+        """
+        Get the current cost of an item
+        """
+        return self._build_info.get_cost(item)
+
+    def get_cps(self, item):
+        """
+        Get the current CPS of an item
+        """
+        return self._build_info.get_cps(item)
+
+    def update_item(self, item):
+        """
+        Update the cost of an item by the growth factor and reindex it.
+        O(log n) for the heaps plus an O(n) shift of the sorted list.
+        """
+        rank = self._ranks[item]
+        del self._sorted[bisect.bisect_left(
+            self._sorted, (self._build_info.get_cost(item), -rank))]
+        self._build_info.update_item(item)
+        self._versions[rank] += 1
+        cost_entry, ratio_entry = self._entries(rank)
+        heapq.heappush(self._by_cost, cost_entry)
+        heapq.heappush(self._by_ratio, ratio_entry)
+        bisect.insort(self._sorted, (self._build_info.get_cost(item), -rank))
+
+    def clone(self):
+        """
+        Return a clone of this index and its BuildInfo
+        """
+        return BuildIndex(self._build_info.clone())
+
+    def cheapest_affordable(self, limit):
+        """
+        Return the cheapest item if it costs no more than limit,
+        otherwise None.
+        """
+        top = self._top(self._by_cost)
+        if top is None or top[0] > limit:
+            return None
+        return self._names[top[1]]
+
+    def most_expensive_affordable(self, limit):
+        """
+        Return the most expensive item that costs no more than limit,
+        or None if there is none.
+        """
+        index = bisect.bisect_right(self._sorted, (limit, 1))
+        if index == 0:
+            return None
+        return self._names[-self._sorted[index - 1][1]]
+
+    def best_ratio_affordable(self, limit):
+        """
+        Return the item with the most CPS per cookie among those that
+        cost no more than limit, or None if there is none.
+        """
+        skipped = []
+        top = self._top(self._by_ratio)
+        while top is not None and self._build_info.get_cost(
+                self._names[top[1]]) > limit:
+            skipped.append(heapq.heappop(self._by_ratio))
+            top = self._top(self._by_ratio)
+        for entry in skipped:
+            heapq.heappush(self._by_ratio, entry)
+        if top is None:
+            return None
+        return self._names[top[1]]
+
+
+def simulate_clicker(build_info, duration, strategy, history=None):
     """
     Function to run a Cookie Clicker game for the given
     duration with the given strategy.  Returns a ClickerState
     object corresponding to the final state of the game.
+    Purchases are recorded into history if given (see ClickerState).
+    Strategies are passed the build state as a BuildIndex.
     """
 
-    build_state = build_info.clone()
-    click_state = ClickerState()
+    build_state = BuildIndex(build_info.clone())
+    click_state = ClickerState(history)
 
     while click_state.get_time() <= duration:
         time_left = duration - click_state.get_time()
@@ -180,6 +478,9 @@ def strategy_cheap(cookies, cps, history, time_left, build_info):
     """
     Always buy the cheapest item you can afford in the time left.
     """
+    if isinstance(build_info, BuildIndex):
+        return build_info.cheapest_affordable(cps * time_left)
+
     items = build_info.build_items()
     costs = {}
 
@@ -197,6 +498,9 @@ def strategy_expensive(cookies, cps, history, time_left, build_info):
     """
     Always buy the most expensive item you can afford in the time left.
     """
+    if isinstance(build_info, BuildIndex):
+        return build_info.most_expensive_affordable(cps * time_left + cookies)
+
     items = build_info.build_items()
     costs = {}
 
@@ -205,7 +509,6 @@ def strategy_expensive(cookies, cps, history, time_left, build_info):
         if cost <= cps * time_left + cookies:
             costs[cost] = item
 
-    print costs
     if len(costs) == 0:
         return None
     else:
@@ -216,6 +519,9 @@ def strategy_best(cookies, cps, history, time_left, build_info):
     """
     The best strategy that you are able to implement.
     """
+    if isinstance(build_info, BuildIndex):
+        return build_info.best_ratio_affordable(cookies + cps * time_left)
+
     cps_to_cost_ratio = {}
     max_poss_production = cookies + cps * time_left
     for item in build_info.build_items():
@@ -228,6 +534,356 @@ def strategy_best(cookies, cps, history, time_left, build_info):
     return None
 
 
+def cheap_key(cost, cps):
+    """
+    Priority of an item for strategy_cheap (lower is better).
+    """
+    return cost
+
+def cheap_budget(cookies, cps, time_left):
+    """
+    Most strategy_cheap will pay for an item.
+    """
+    return cps * time_left
+
+def best_key(cost, cps):
+    """
+    Priority of an item for strategy_best (lower is better).
+    """
+    return -cps / cost
+
+def best_budget(cookies, cps, time_left):
+    """
+    Most strategy_best will pay for an item.
+    """
+    return cookies + cps * time_left
+
+# Strategies whose choice only depends on the item costs and CPS, as
+# (priority function, budget function, whether to skip over items that
+# are over budget rather than give up).  simulate_clicker_fast can
+# replace calls to these with a priority queue.
+STATIONARY_STRATEGIES = {strategy_cheap: (cheap_key, cheap_budget, False),
+                         strategy_best: (best_key, best_budget, True)}
+
+def simulate_clicker_fast(build_info, duration, strategy, history=None):
+    """
+    Same as simulate_clicker, but for the strategies in
+    STATIONARY_STRATEGIES the next purchase comes from a priority
+    queue of items instead of calling the strategy, and a run of
+    purchases of the same item is bought without touching the queue.
+    Other strategies are passed on to simulate_clicker.
+    """
+    if strategy not in STATIONARY_STRATEGIES:
+        return simulate_clicker(build_info, duration, strategy, history)
+    key, budget, skip = STATIONARY_STRATEGIES[strategy]
+
+    build_state = build_info.clone()
+    click_state = ClickerState(history)
+    queue = [(key(build_state.get_cost(item), build_state.get_cps(item)), item)
+             for item in build_state.build_items()]
+    heapq.heapify(queue)
+
+    while click_state.get_time() <= duration:
+        time_left = duration - click_state.get_time()
+        limit = budget(click_state.get_cookies(), click_state.get_cps(),
+                       time_left)
+
+        # Take the first item in priority order that is within budget.
+        skipped = []
+        while (skip and len(queue) > 0 and
+               build_state.get_cost(queue[0][1]) > limit):
+            skipped.append(heapq.heappop(queue))
+        if len(queue) == 0 or build_state.get_cost(queue[0][1]) > limit:
+            click_state.wait(time_left)
+            break
+        next_purchase = heapq.heappop(queue)[1]
+        for entry in skipped:
+            heapq.heappush(queue, entry)
+
+        # Keep buying it for as long as it would stay first in the
+        # queue and within budget.
+        out_of_time = False
+        while True:
+            item_cost = build_state.get_cost(next_purchase)
+            time_needed = click_state.time_until(item_cost)
+            if time_needed > time_left:
+                out_of_time = True
+                break
+            click_state.wait(time_needed)
+            click_state.buy_item(next_purchase, item_cost,
+                                 build_state.get_cps(next_purchase))
+            build_state.update_item(next_purchase)
+
+            time_left = duration - click_state.get_time()
+            priority = key(build_state.get_cost(next_purchase),
+                           build_state.get_cps(next_purchase))
+            if len(queue) > 0 and priority >= queue[0][0]:
+                break
+            if build_state.get_cost(next_purchase) > budget(
+                    click_state.get_cookies(), click_state.get_cps(), time_left):
+                break
+
+        heapq.heappush(queue, (key(build_state.get_cost(next_purchase),
+                                   build_state.get_cps(next_purchase)),
+                               next_purchase))
+        if out_of_time:
+            click_state.wait(time_left)
+            break
+
+    return click_state
+
+# Strategies played in a tournament, by name.  Add your own with
+# register_strategy; they must be module level functions so they can
+# be sent to worker processes.
+STRATEGIES = {"Cursor": strategy_cursor_broken,
+              "None": strategy_none,
+              "Cheap": strategy_cheap,
+              "Expensive": strategy_expensive,
+              "Best": strategy_best}
+
+def register_strategy(strategy_name, strategy):
+    """
+    Add a strategy to the tournament.
+    """
+    STRATEGIES[strategy_name] = strategy
+
+def tournament_task(task):
+    """
+    Play one tournament game.  Takes a tuple (strategy name, strategy,
+    duration, build name, BuildInfo) so it can be mapped over a
+    process pool, and returns a result tuple (strategy name, build
+    name, duration, total cookies, final CPS, seconds taken).
+    """
+    strategy_name, strategy, duration, build_name, build_info = task
+    start = time.time()
+    state = simulate_clicker_fast(build_info, duration, strategy,
+                                  PurchaseHistory(16, ring=True))
+    elapsed = time.time() - start
+    return (strategy_name, build_name, duration, state.get_total_cookies(),
+            state.get_cps(), elapsed)
+
+def run_tournament(durations, builds=None, strategy_names=None,
+                   processes=None):
+    """
+    Play every strategy for every duration against every build (a
+    dictionary of BuildInfo objects by name, the standard build by
+    default) across a pool of worker processes.  Returns a list of
+    result tuples as made by tournament_task.
+    """
+    import multiprocessing
+
+    if builds is None:
+        builds = {"Standard": provided.BuildInfo()}
+    if strategy_names is None:
+        strategy_names = sorted(STRATEGIES)
+    tasks = []
+    for strategy_name in strategy_names:
+        for build_name in sorted(builds):
+            for duration in durations:
+                tasks.append((strategy_name, STRATEGIES[strategy_name],
+                              duration, build_name, builds[build_name]))
+
+    if processes == 1:
+        return [tournament_task(task) for task in tasks]
+    pool = multiprocessing.Pool(processes)
+    results = pool.map(tournament_task, tasks, 1)
+    pool.close()
+    pool.join()
+    return results
+
+def format_tournament(results):
+    """
+    Return tournament results as a table grouped by build and
+    duration, best total first.
+    """
+    lines = ["%-12s %-10s %12s %14s %12s %9s" %
+             ("Strategy", "Build", "Duration", "Total", "CPS", "Seconds")]
+    for result in sorted(results, key=lambda result: (result[1], result[2],
+                                                      -result[3])):
+        lines.append("%-12s %-10s %12.5g %14.6g %12.6g %9.3f" % result)
+    return "\n".join(lines)
+
+class PurchasePlanner:
+    """
+    Offline planner that works out a list of purchases ahead of time.
+
+    At each purchase it runs a branch-and-bound search over the next
+    depth purchases and makes the first purchase of the best sequence.
+    Sequences are scored by net worth at a common time a few payback
+    periods ahead: cookies plus CPS valued at the best CPS to cost
+    ratio left on offer.  Branches are cut when an upper bound from
+    the most CPS the remaining purchases could add cannot beat the
+    best sequence so far, and when another order of the same purchases
+    got there no later with at least as many cookies.  The plan that
+    strategy_best would follow is kept instead if it does better.
+    """
+
+    def __init__(self, build_info, duration, depth=2, horizon=3.0):
+        self._build_info = build_info
+        self._duration = duration
+        self._depth = depth
+        self._horizon = horizon
+        self._names = sorted(build_info.build_items())
+        self._item_cps = [build_info.get_cps(item) for item in self._names]
+        self._max_cps = max(self._item_cps)
+        # Cost of each copy of each item, filled in from a BuildInfo
+        # clone as needed so costs match the simulation exactly.
+        self._schedules = [[build_info.get_cost(item)] for item in self._names]
+        self._clones = [build_info.clone() for dummy_item in self._names]
+        self._counts = [0] * len(self._names)
+        # Time at which sequences are compared
+        self._end = duration
+        self._nodes = 0
+        self._pruned = 0
+
+    def _cost(self, rank, count):
+        """
+        Return the cost of buying an item when count are already owned.
+        """
+        schedule = self._schedules[rank]
+        while len(schedule) <= count:
+            self._clones[rank].update_item(self._names[rank])
+            schedule.append(self._clones[rank].get_cost(self._names[rank]))
+        return schedule[count]
+
+    def _best_ratio(self, extra):
+        """
+        Return the best CPS to cost ratio on offer after buying extra
+        more copies of every item, a lower bound on the ratio after
+        any extra purchases.
+        """
+        return max(self._item_cps[rank] / self._cost(rank, count + extra)
+                   for rank, count in enumerate(self._counts))
+
+    def _search(self, depth, now, cookies, cps, first, memo, best):
+        """
+        Score the current sequence and search its extensions, keeping
+        the best score and first purchase in best.
+        """
+        self._nodes += 1
+        end = self._end
+        costs = [self._cost(rank, count)
+                 for rank, count in enumerate(self._counts)]
+        ratio = max(self._item_cps[rank] / costs[rank]
+                    for rank in range(len(costs)))
+        value = cookies + cps * (end - now) + cps / ratio
+        if first is not None and value > best[0]:
+            best[0] = value
+            best[1] = first
+        if depth == 0:
+            return
+
+        gain = max([self._item_cps[rank] * (end - now) - costs[rank]
+                    for rank in range(len(costs))] + [0.0])
+        bound = (cookies + cps * (end - now) + depth * gain +
+                 (cps + depth * self._max_cps) / self._best_ratio(depth))
+        if bound <= best[0]:
+            self._pruned += 1
+            return
+
+        order = sorted(range(len(costs)),
+                       key=lambda rank: -self._item_cps[rank] / costs[rank])
+        for rank in order:
+            cost = costs[rank]
+            if cost < cookies:
+                wait = 0.0
+            else:
+                wait = math.ceil((cost - cookies) / cps)
+            if wait > self._duration - now or now + wait > end:
+                continue
+            new_time = now + wait
+            new_cookies = cookies + wait * cps - cost
+            new_cps = cps + self._item_cps[rank]
+
+            # Another order of the same purchases that finished no later
+            # with at least as many cookies (at this CPS) is as good.
+            self._counts[rank] += 1
+            key = tuple(self._counts)
+            worth = new_cookies - new_cps * new_time
+            seen = memo.get(key)
+            if seen is not None and seen[0] <= new_time and seen[1] >= worth:
+                self._pruned += 1
+            else:
+                memo[key] = (new_time, worth)
+                if first is None:
+                    self._search(depth - 1, new_time, new_cookies, new_cps,
+                                 rank, memo, best)
+                else:
+                    self._search(depth - 1, new_time, new_cookies, new_cps,
+                                 first, memo, best)
+            self._counts[rank] -= 1
+
+    def plan(self):
+        """
+        Return the list of items to buy, in order.
+        """
+        self._counts = [0] * len(self._names)
+        state = ClickerState(PurchaseHistory(1, ring=True))
+        plan = []
+        while state.get_time() <= self._duration:
+            now = state.get_time()
+            self._end = min(self._duration,
+                            now + self._horizon / self._best_ratio(0))
+            best = [float("-inf"), None]
+            self._search(self._depth, now, state.get_cookies(),
+                         state.get_cps(), None, {}, best)
+            if best[1] is None:
+                break
+
+            rank = best[1]
+            cost = self._cost(rank, self._counts[rank])
+            state.wait(state.time_until(cost))
+            state.buy_item(self._names[rank], cost, self._item_cps[rank])
+            self._counts[rank] += 1
+            plan.append(self._names[rank])
+        state.wait(self._duration - state.get_time())
+
+        greedy = simulate_clicker_fast(self._build_info, self._duration,
+                                       strategy_best)
+        if greedy.get_total_cookies() > state.get_total_cookies():
+            return [entry[1] for entry in greedy.get_history()[1:]]
+        return plan
+
+    def get_nodes(self):
+        """
+        Return the number of search nodes visited
+        """
+        return self._nodes
+
+    def get_pruned(self):
+        """
+        Return the number of branches cut by the bound or by a
+        dominating order of the same purchases
+        """
+        return self._pruned
+
+    def get_prune_rate(self):
+        """
+        Return the fraction of branches cut per node visited
+        """
+        if self._nodes == 0:
+            return 0.0
+        return float(self._pruned) / self._nodes
+
+
+def plan_strategy(plan):
+    """
+    Return a strategy that makes the purchases in plan, in order,
+    and then stops buying.
+    """
+    def strategy(cookies, cps, history, time_left, build_info):
+        """
+        Buy the next item in the plan.
+        """
+        if isinstance(history, HistoryView):
+            purchases = history.get_purchases()
+        else:
+            purchases = len(history) - 1
+        if purchases < len(plan):
+            return plan[purchases]
+        return None
+    return strategy
+
 def run_strategy(strategy_name, time, strategy):
     """
     Run a simulation for the given time with one strategy.
@@ -255,4 +911,11 @@ def run():
     # run_strategy("Expensive", SIM_TIME, strategy_expensive)
     run_strategy("Best", SIM_TIME, strategy_best)
 
+    # Or replay a plan worked out ahead of time
+    #planner = PurchasePlanner(provided.BuildInfo(), SIM_TIME)
+    #run_strategy("Planned", SIM_TIME, plan_strategy(planner.plan()))
+
+    # Or play every strategy against each other
+    #print format_tournament(run_tournament([1000.0, SIM_TIME]))
+
 run()
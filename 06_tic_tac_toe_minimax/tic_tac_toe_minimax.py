@@ -2,6 +2,7 @@
 Mini-max Tic-Tac-Toe Player
 """
 
+import time
 import poc_ttt_gui
 import poc_ttt_provided as provided
 
@@ -14,49 +15,703 @@ SCORES = {provided.PLAYERX: 1,
           provided.DRAW: 0,
           provided.PLAYERO: -1}
 
-def mm_move(board, player):
+# Base 3 digit used for each square when encoding a board.
+DIGITS = {provided.EMPTY: 0,
+          provided.PLAYERX: 1,
+          provided.PLAYERO: 2}
+
+# Transposition tables for mm_move, one per board size, keyed on
+# (player, canonical board code) and holding (score, move in canonical
+# coordinates).  The tables only hold results for one win rule, which
+# is kept in TT_RULE.
+TRANSPOSITIONS = {}
+TT_RULE = {'reverse': None}
+TT_STATS = {'hits': 0, 'misses': 0, 'nodes': 0}
+SYMMETRIES = {}
+
+def board_symmetries(dim):
+    """
+    Returns the 8 rotations and reflections of a dim x dim board as
+    lists mapping each flat square index to its image.
+    """
+    if dim not in SYMMETRIES:
+        last = dim - 1
+        transforms = [lambda row, col: (row, col),
+                      lambda row, col: (col, last - row),
+                      lambda row, col: (last - row, last - col),
+                      lambda row, col: (last - col, row),
+                      lambda row, col: (row, last - col),
+                      lambda row, col: (last - row, col),
+                      lambda row, col: (col, row),
+                      lambda row, col: (last - col, last - row)]
+        SYMMETRIES[dim] = []
+        for transform in transforms:
+            perm = []
+            for square in range(dim * dim):
+                image = transform(square // dim, square % dim)
+                perm.append(image[0] * dim + image[1])
+            SYMMETRIES[dim].append(perm)
+    return SYMMETRIES[dim]
+
+def canonical_code(board):
+    """
+    Returns a tuple (code, perm) where code is the smallest base 3
+    encoding of the board over all of its symmetries and perm is the
+    symmetry that produces it.
+    """
+    dim = board.get_dim()
+    digits = [DIGITS[board.square(square // dim, square % dim)]
+              for square in range(dim * dim)]
+    best_code = None
+    best_perm = None
+    for perm in board_symmetries(dim):
+        code = 0
+        for square in range(dim * dim):
+            if digits[square]:
+                code += digits[square] * 3 ** perm[square]
+        if best_code is None or code < best_code:
+            best_code = code
+            best_perm = perm
+    return best_code, best_perm
+
+def board_reverse(board):
+    """
+    Returns True if the board is played with the reverse rule (three
+    in a row loses), found by completing a line on a clone of the
+    board.  Returns False if no player can complete any line, as the
+    rule does not matter then.
+    """
+    dim = board.get_dim()
+    lines = [[(row, col) for col in range(dim)] for row in range(dim)]
+    lines += [[(row, col) for row in range(dim)] for col in range(dim)]
+    lines.append([(idx, idx) for idx in range(dim)])
+    lines.append([(idx, dim - idx - 1) for idx in range(dim)])
+    for line in lines:
+        marks = set([board.square(row, col) for row, col in line])
+        marks.discard(provided.EMPTY)
+        if len(marks) <= 1:
+            player = provided.PLAYERX
+            if marks:
+                player = marks.pop()
+            probe = board.clone()
+            for row, col in line:
+                probe.move(row, col, player)
+            return probe.check_win() != player
+    return False
+
+def clear_transpositions():
+    """
+    Empty the transposition tables and reset their counters.
+    """
+    TRANSPOSITIONS.clear()
+    TT_RULE['reverse'] = None
+    TT_STATS['hits'] = 0
+    TT_STATS['misses'] = 0
+    TT_STATS['nodes'] = 0
+
+def mm_move(board, player, processes=1):
     """
     Make a move on the board.
 
     Returns a tuple with two elements.  The first element is the score
     of the given board and the second element is the desired move as a
     tuple, (row, col).
+
+    Results are cached in TRANSPOSITIONS, so a position reached again
+    by another move order, or any rotation or reflection of it, is not
+    searched twice.  The tables are emptied when the board's win rule
+    differs from the one they were filled with.  With processes > 1
+    the moves from this board are searched in parallel by
+    mm_move_parallel instead.
     """
+    if processes != 1:
+        return mm_move_parallel(board, player, processes)
 
+    reverse = board_reverse(board)
+    if TT_RULE['reverse'] != reverse:
+        TRANSPOSITIONS.clear()
+        TT_RULE['reverse'] = reverse
+    dim = board.get_dim()
+    score, square = mm_cached(SearchBoard(board, reverse), player)
+    if square is None:
+        return score, (-1, -1)
+    return score, (square // dim, square % dim)
+
+def mm_cached(board, player):
+    """
+    Same as mm_move, but for a SearchBoard played with the rule in
+    TT_RULE, and returns (score, flat square) with None for the
+    square once the game is over.
+    """
+    TT_STATS['nodes'] += 1
     winner = board.check_win()
 
+    if winner:
+        return SCORES[winner], None
+
+    code, perm, inverse = board.canonical()
+    table = TRANSPOSITIONS.setdefault(board.get_dim(), {})
+    cached = table.get((player, code))
+    if cached is not None:
+        TT_STATS['hits'] += 1
+        return cached[0], inverse[cached[1]]
+    TT_STATS['misses'] += 1
+
+    result = mm_search(board, player)
+    table[(player, code)] = (result[0], perm[result[1]])
+    return result
+
+def mm_search(board, player):
+    """
+    Search every move from a SearchBoard that is not yet won, using
+    mm_cached for the replies, and return the best (score, flat
+    square).  Moves are made and taken back on the board itself and
+    tried in row-major order.
+    """
+    mm_score = -2
+    best_score = -2
+    best_square = None
+    next_player = provided.switch_player(player)
+
+    for square in range(board.get_dim() * board.get_dim()):
+        if not board.is_empty(square):
+            continue
+        board.make_move(square, player)
+        poss_score = mm_cached(board, next_player)[0]
+        board.undo_move(square)
+
+        if poss_score * SCORES[player] > mm_score:
+            mm_score = poss_score * SCORES[player]
+            best_score = poss_score
+            best_square = square
+        if mm_score == 1:
+            break
+
+    return best_score, best_square
+
+class SearchBoard:
+    """
+    Mutable board for searching without cloning.  Moves are made and
+    taken back with make_move and undo_move, each player's marks are
+    counted per line so a win is spotted from the lines through the
+    last move, and the base 3 codes of all 8 symmetries are updated
+    as squares change.  The empty squares are kept in a list that
+    shrinks by swapping the square played to the end, and undo_move
+    swaps it back, so nothing is rebuilt per move.  Wins follow the
+    board's own rule unless reverse is given.
+    """
+
+    def __init__(self, board, reverse=None):
+        dim = board.get_dim()
+        if reverse is None:
+            reverse = board_reverse(board)
+        self._dim = dim
+        self._reverse = reverse
+        self._squares = [board.square(square // dim, square % dim)
+                         for square in range(dim * dim)]
+        self._empty = list(range(dim * dim))
+        self._position = list(range(dim * dim))
+        # Position each played square was swapped from, by move number.
+        self._swapped_from = [0] * (dim * dim)
+
+        lines = [[row * dim + col for col in range(dim)] for row in range(dim)]
+        lines += [[row * dim + col for row in range(dim)] for col in range(dim)]
+        lines.append([idx * dim + idx for idx in range(dim)])
+        lines.append([idx * dim + dim - idx - 1 for idx in range(dim)])
+        self._lines_through = [[] for dummy in range(dim * dim)]
+        for line in range(len(lines)):
+            for square in lines[line]:
+                self._lines_through[square].append(line)
+
+        self._perms = board_symmetries(dim)
+        self._inverses = []
+        for perm in self._perms:
+            inverse = [0] * (dim * dim)
+            for square in range(dim * dim):
+                inverse[perm[square]] = square
+            self._inverses.append(inverse)
+        self._weights = [[3 ** perm[square] for square in range(dim * dim)]
+                         for perm in self._perms]
+
+        self._counts = {provided.PLAYERX: [0] * len(lines),
+                        provided.PLAYERO: [0] * len(lines)}
+        self._codes = [0] * len(self._perms)
+        self._num_empty = dim * dim
+        self._winner = None
+        for square in range(dim * dim):
+            if self._squares[square] != provided.EMPTY:
+                player = self._squares[square]
+                self._squares[square] = provided.EMPTY
+                self.make_move(square, player)
+        self._winner = board.check_win()
+
+    def get_dim(self):
+        """
+        Return the dimension of the board.
+        """
+        return self._dim
+
+    def get_reverse(self):
+        """
+        Return True if the board is played with the reverse rule.
+        """
+        return self._reverse
+
+    def get_empty(self):
+        """
+        Return a list of the empty flat square indices.
+        """
+        return self._empty[:self._num_empty]
+
+    def get_num_empty(self):
+        """
+        Return the number of empty squares.
+        """
+        return self._num_empty
+
+    def fill_empty(self, buffer):
+        """
+        Copy the empty flat square indices into the start of buffer
+        and return how many there are.
+        """
+        for index in range(self._num_empty):
+            buffer[index] = self._empty[index]
+        return self._num_empty
+
+    def is_empty(self, square):
+        """
+        Return True if the flat square is empty.
+        """
+        return self._squares[square] == provided.EMPTY
+
+    def check_win(self):
+        """
+        Return the winner, DRAW, or None if the game is in progress.
+        """
+        return self._winner
+
+    def make_move(self, square, player):
+        """
+        Place player on an empty flat square.
+        """
+        self._squares[square] = player
+        last = self._num_empty - 1
+        position = self._position[square]
+        other = self._empty[last]
+        self._empty[position] = other
+        self._position[other] = position
+        self._empty[last] = square
+        self._position[square] = last
+        self._swapped_from[self._dim * self._dim - 1 - last] = position
+        self._num_empty = last
+        digit = DIGITS[player]
+        for index in range(len(self._codes)):
+            self._codes[index] += digit * self._weights[index][square]
+
+        counts = self._counts[player]
+        for line in self._lines_through[square]:
+            counts[line] += 1
+            if counts[line] == self._dim:
+                if self._reverse:
+                    self._winner = provided.switch_player(player)
+                else:
+                    self._winner = player
+        if self._winner is None and self._num_empty == 0:
+            self._winner = provided.DRAW
+
+    def undo_move(self, square):
+        """
+        Take back the last move, which was made on square.
+        """
+        player = self._squares[square]
+        self._squares[square] = provided.EMPTY
+        last = self._num_empty
+        position = self._swapped_from[self._dim * self._dim - 1 - last]
+        other = self._empty[position]
+        self._empty[last] = other
+        self._position[other] = last
+        self._empty[position] = square
+        self._position[square] = position
+        self._num_empty = last + 1
+        digit = DIGITS[player]
+        for index in range(len(self._codes)):
+            self._codes[index] -= digit * self._weights[index][square]
+
+        counts = self._counts[player]
+        for line in self._lines_through[square]:
+            counts[line] -= 1
+        self._winner = None
+
+    def canonical(self):
+        """
+        Returns a tuple (code, perm, inverse) like canonical_code, plus
+        the inverse of the symmetry.
+        """
+        best = 0
+        for index in range(1, len(self._codes)):
+            if self._codes[index] < self._codes[best]:
+                best = index
+        return self._codes[best], self._perms[best], self._inverses[best]
+
+# Kinds of value stored in the alpha-beta transposition table.
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+class AlphaBetaSearch:
+    """
+    Negamax search with alpha-beta pruning and iterative deepening.
+    Moves are tried in the order: transposition table move, killer
+    moves for the ply, then by history score.  Positions that are
+    not decided within the depth limit score 0.  Boards are played
+    with their own win rule unless reverse is given.
+    """
+
+    def __init__(self, reverse=None):
+        self._reverse = reverse
+        self._table = {}
+        self._history = {}
+        self._killers = {}
+        # Move and sort rank buffers for each ply, see order_moves.
+        self._moves = []
+        self._ranks = []
+        self._nodes = 0
+        self._elapsed = 0.0
+
+    def get_nodes(self):
+        """
+        Return the number of nodes searched so far.
+        """
+        return self._nodes
+
+    def get_nodes_per_sec(self):
+        """
+        Return the search speed over all calls to search.
+        """
+        if self._elapsed == 0:
+            return 0.0
+        return self._nodes / self._elapsed
+
+    def order_moves(self, board, tt_square, ply):
+        """
+        Sort the empty squares of a SearchBoard into the order they
+        should be searched in, in the move buffer for the ply, and
+        return how many there are.  The buffers are reused from node
+        to node, and sorted in place by insertion.
+        """
+        size = board.get_dim() * board.get_dim()
+        if len(self._moves) > 0 and len(self._moves[0]) < size:
+            self._moves = []
+            self._ranks = []
+        while len(self._moves) <= ply:
+            self._moves.append([0] * size)
+            self._ranks.append([0] * size)
+        moves = self._moves[ply]
+        ranks = self._ranks[ply]
+        killers = self._killers.get(ply, ())
+        history = self._history
+
+        count = board.fill_empty(moves)
+        for index in range(count):
+            square = moves[index]
+            if square == tt_square:
+                rank = 0
+            elif square in killers:
+                rank = 1 + killers.index(square)
+            else:
+                rank = 3
+            score = history.get(square, 0)
+            position = index
+            while position > 0 and (
+                    ranks[position - 1] > rank or
+                    (ranks[position - 1] == rank == 3 and
+                     history.get(moves[position - 1], 0) < score)):
+                moves[position] = moves[position - 1]
+                ranks[position] = ranks[position - 1]
+                position -= 1
+            moves[position] = square
+            ranks[position] = rank
+        return count
+
+    def add_cutoff(self, square, depth, ply):
+        """
+        Record that square caused a beta cutoff.
+        """
+        self._history[square] = self._history.get(square, 0) + depth * depth
+        killers = self._killers.setdefault(ply, [])
+        if square not in killers:
+            killers.insert(0, square)
+            del killers[2:]
+
+    def negamax(self, board, player, depth, alpha, beta, ply):
+        """
+        Return the value of a SearchBoard for player, who is to move,
+        searching at most depth moves ahead.  Also returns the best
+        flat square, or None at the leaves, as a tuple (value, square).
+        """
+        self._nodes += 1
+        winner = board.check_win()
+        if winner:
+            return SCORES[winner] * SCORES[player], None
+
+        depth = min(depth, board.get_num_empty())
+        if depth == 0:
+            return 0, None
+
+        code, perm, inverse = board.canonical()
+        key = (board.get_dim(), board.get_reverse(), player, code)
+        entry = self._table.get(key)
+        tt_square = None
+        if entry is not None:
+            tt_square = inverse[entry[3]]
+            if entry[0] >= depth:
+                if entry[2] == EXACT:
+                    return entry[1], tt_square
+                elif entry[2] == LOWER:
+                    alpha = max(alpha, entry[1])
+                else:
+                    beta = min(beta, entry[1])
+                if alpha >= beta:
+                    return entry[1], tt_square
+
+        alpha_orig = alpha
+        best_value = -2
+        best_square = None
+        next_player = provided.switch_player(player)
+        count = self.order_moves(board, tt_square, ply)
+        moves = self._moves[ply]
+        for index in range(count):
+            square = moves[index]
+            board.make_move(square, player)
+            value = -self.negamax(board, next_player, depth - 1,
+                                  -beta, -alpha, ply + 1)[0]
+            board.undo_move(square)
+            if value > best_value:
+                best_value = value
+                best_square = square
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                self.add_cutoff(square, depth, ply)
+                break
+
+        if best_value <= alpha_orig:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self._table[key] = (depth, best_value, flag, perm[best_square])
+        return best_value, best_square
+
+    def search(self, board, player):
+        """
+        Same as mm_move: returns (score of the board, best move).
+        Deepens one move at a time until the result is decided or
+        the whole game tree has been searched.
+        """
+        winner = board.check_win()
+        if winner:
+            return (SCORES[winner], (-1, -1))
+
+        start = time.time()
+        dim = board.get_dim()
+        search_board = SearchBoard(board, self._reverse)
+        num_empty = search_board.get_num_empty()
+        for depth in range(1, num_empty + 1):
+            value, square = self.negamax(search_board, player, depth, -1, 1, 0)
+            if value != 0:
+                break
+        self._elapsed += time.time() - start
+        return value * SCORES[player], (square // dim, square % dim)
+
+AB_SEARCH = AlphaBetaSearch()
+
+def ab_move(board, player):
+    """
+    Same as mm_move, but uses the shared alpha-beta search.
+    """
+    return AB_SEARCH.search(board, player)
+
+# Per-process state for mm_move_parallel workers: the shared best
+# root value found so far and the worker's own search.
+WORKER_STATE = {}
+
+def init_root_worker(bound, reverse):
+    """
+    Set up a worker process for mm_move_parallel.
+    """
+    WORKER_STATE['bound'] = bound
+    WORKER_STATE['reverse'] = reverse
+    WORKER_STATE['search'] = AlphaBetaSearch(reverse)
+
+def search_root_move(task):
+    """
+    Search one root move for mm_move_parallel.  Takes a tuple
+    (board, player, square) and returns (value for player, square,
+    exact).  The value is only exact if it beats the shared bound read
+    before the search; otherwise it is an upper bound.  Raises the
+    shared bound when it beats it.
+    """
+    board, player, square = task
+    bound = WORKER_STATE['bound']
+    search = WORKER_STATE['search']
+    alpha = bound.value
+    if alpha >= 1:
+        return -2, square, False
+
+    search_board = SearchBoard(board, WORKER_STATE['reverse'])
+    search_board.make_move(square, player)
+    depth = search_board.get_num_empty()
+    value = -search.negamax(search_board, provided.switch_player(player),
+                            depth, -1, -alpha, 1)[0]
+    bound.get_lock().acquire()
+    if value > bound.value:
+        bound.value = value
+    bound.get_lock().release()
+    return value, square, value > alpha
+
+def mm_move_parallel(board, player, processes=None, reverse=None):
+    """
+    Same as mm_move, but searches each possible move on its own in a
+    pool of worker processes.  The best value found so far is shared
+    between the workers and used as the alpha bound of later searches.
+    Boards are played with their own win rule unless reverse is given.
+    """
+    import multiprocessing
+
+    winner = board.check_win()
     if winner:
         return (SCORES[winner], (-1, -1))
-    else:
-        poss_moves = board.get_empty_squares()
+    if reverse is None:
+        reverse = board_reverse(board)
+
+    dim = board.get_dim()
+    poss_moves = board.get_empty_squares()
+    tasks = [(board, player, move[0] * dim + move[1]) for move in poss_moves]
+    bound = multiprocessing.Value('i', -2)
+    pool = multiprocessing.Pool(processes, init_root_worker, (bound, reverse))
+    results = pool.map(search_root_move, tasks, 1)
+    pool.close()
+    pool.join()
 
-        mm_score = -2
-        best_score = -2
-        best_move = (-1, -1)
+    exact = [result for result in results if result[2]]
+    best_value, best_square = max(exact, key=lambda result: result[0])[:2]
+    return best_value * SCORES[player], (best_square // dim, best_square % dim)
+
+def compare_search(board, player):
+    """
+    Search board from scratch with both mm_move, which looks at every
+    move but caches positions, and the alpha-beta search, and return
+    the node counts and nodes per second of each as a dictionary.
+    """
+    clear_transpositions()
+    start = time.time()
+    mm_move(board, player)
+    mm_elapsed = max(time.time() - start, 1e-9)
+
+    search = AlphaBetaSearch()
+    search.search(board, player)
+    return {'mm_nodes': TT_STATS['nodes'],
+            'mm_nodes_per_sec': TT_STATS['nodes'] / mm_elapsed,
+            'ab_nodes': search.get_nodes(),
+            'ab_nodes_per_sec': search.get_nodes_per_sec()}
+
+# Opening book for the 3x3 board.  The book file holds one byte per
+# base 3 board code for X to move, followed by one per code for O to
+# move.  Each byte is (score + 1) << 4 | square of the best move, or
+# NO_ENTRY for finished or impossible positions.
+BOOK_DIM = 3
+BOOK_SIZE = 3 ** (BOOK_DIM * BOOK_DIM)
+BOOK_FILE = 'ttt_book.bin'
+NO_ENTRY = 0xFF
+
+def book_index(board, player):
+    """
+    Returns the offset of a 3x3 position in the book.
+    """
+    code = 0
+    for square in range(BOOK_DIM * BOOK_DIM):
+        code += DIGITS[board.square(square // BOOK_DIM, square % BOOK_DIM)] * 3 ** square
+    if player == provided.PLAYERO:
+        code += BOOK_SIZE
+    return code
+
+def build_book(path):
+    """
+    Solve every 3x3 position that can come up in a game, with either
+    player to move, and write the book to path.
+    """
+    book = bytearray([NO_ENTRY] * (2 * BOOK_SIZE))
+    for code in range(BOOK_SIZE):
+        board = provided.TTTBoard(BOOK_DIM)
+        counts = {provided.PLAYERX: 0, provided.PLAYERO: 0}
+        for square in range(BOOK_DIM * BOOK_DIM):
+            digit = (code // 3 ** square) % 3
+            if digit:
+                player = (provided.PLAYERX, provided.PLAYERO)[digit - 1]
+                board.move(square // BOOK_DIM, square % BOOK_DIM, player)
+                counts[player] += 1
+        if board.check_win():
+            continue
+        for player in (provided.PLAYERX, provided.PLAYERO):
+            # Either player may have started, but the player to move
+            # never has more marks than the other player.
+            difference = counts[player] - counts[provided.switch_player(player)]
+            if difference in (0, -1):
+                score, move = mm_move(board, player)
+                book[book_index(board, player)] = ((score + 1) << 4 |
+                                                   move[0] * BOOK_DIM + move[1])
+    book_file = open(path, 'wb')
+    book_file.write(book)
+    book_file.close()
+
+class BookPlayer:
+    """
+    Perfect 3x3 player that looks every move up in a book built by
+    build_book.  The book is memory mapped, so nothing is solved or
+    read up front.  Falls back to ab_move for other board sizes and
+    for the reverse rule.
+    """
 
-        for move in poss_moves:
-            mm_board = board.clone()
-            mm_board.move(move[0], move[1], player)
+    def __init__(self, path=None):
+        import mmap
+        import os
 
-            next_player = provided.switch_player(player)
-            next_mm = mm_move(mm_board, next_player)
-            poss_score = next_mm[0]
+        if path is None:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                BOOK_FILE)
+        book_file = open(path, 'rb')
+        self._book = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        book_file.close()
 
-            if poss_score * SCORES[player] > mm_score:
-                mm_score = poss_score * SCORES[player]
-                best_score = poss_score
-                best_move = move
-            if mm_score == 1:
-                return (best_score, best_move)
+    def lookup(self, board, player):
+        """
+        Same as mm_move: returns (score of the board, best move).
+        """
+        if board.get_dim() != BOOK_DIM or board_reverse(board):
+            return ab_move(board, player)
+        winner = board.check_win()
+        if winner:
+            return (SCORES[winner], (-1, -1))
+        index = book_index(board, player)
+        entry = bytearray(self._book[index:index + 1])[0]
+        if entry == NO_ENTRY:
+            return ab_move(board, player)
+        square = entry & 0xF
+        return (entry >> 4) - 1, (square // BOOK_DIM, square % BOOK_DIM)
 
-    return best_score, best_move
+    def __call__(self, board, player, trials):
+        """
+        Same as move_wrapper.
+        """
+        return self.lookup(board, player)[1]
 
 def move_wrapper(board, player, trials):
     """
     Wrapper to allow the use of the same infrastructure that was used
     for Monte Carlo Tic-Tac-Toe.
     """
-    move = mm_move(board, player)
+    move = ab_move(board, player)
     assert move[1] != (-1, -1), "returned illegal move (-1, -1)"
     return move[1]
 